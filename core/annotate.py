@@ -1,10 +1,13 @@
+import math
+import time
+
 import cv2
 import numpy as np
 import tkinter as tk
 from tkinter import simpledialog, messagebox
 from functools import partial
 
-from grid import Cell, load_grid, save_grid, get_by_idx, load_grid_meta, grid_to_pixel, pixel_to_grid
+from grid import Cell, CELL_DTYPE, cells_to_array, build_idx_map, load_grid, save_grid, get_by_idx, load_grid_meta, grid_to_pixel, pixel_to_grid, grid_to_pixel_vec
 
 # 全域變數
 original_image = None
@@ -21,22 +24,90 @@ pan_offset_x, pan_offset_y = 0, 0
 panning = False
 start_pan_x, start_pan_y = -1, -1
 
+# 縮放後影像快取（僅在 zoom_factor 改變時重新 resize）
+_scaled_cache = {"zoom": None, "interp": None, "img": None}
+
+# OpenCL 可用時的原圖 UMat，縮小整張圖時交給 T-API 加速；不可用時為 None 走 numpy
+_original_umat = None
+
+# 互動中（平移/滾輪縮放）改用最近鄰插值，停止操作後再以完整品質重繪
+_interactive = False
+_last_interaction_ts = 0.0
+INTERACTIVE_SETTLE_SEC = 0.15
+
+# 底圖快取（影像 + cells），框選拖曳時只在其上疊加暫時矩形。
+# cells、平移、縮放的變動都會經過 redraw_image，因此由它負責更新。
+_base_image = None
+_base_valid = False
+
+# cells 數值欄位的 SoA (CELL_DTYPE)，供向量化點擊判斷與批次繪製；
+# _idx_map 為 idx -> cells 位置；_cell_px 為由 grid 座標算出的原圖像素矩形 (N, 4) = [x1, y1, x2, y2]，
+# 重繪時只需乘上縮放、加上平移。cells 增刪或 grid_meta 變動時標記重建
+_cell_arr = np.empty(0, dtype=CELL_DTYPE)
+_idx_map = {}
+_cell_px = np.empty((0, 4), dtype=np.float64)
+_cells_dirty = True
+
+# MOUSEMOVE 觸發的重繪限制在約 60 Hz；過密的事件只記下待處理狀態，
+# 於放開按鍵或主迴圈 waitKey 後補畫
+MOUSEMOVE_MIN_INTERVAL = 1 / 60
+_last_draw_ts = 0.0
+_redraw_pending = False
+_pending_bbox_pt = None
+# 主迴圈每次 waitKey 的等待時間 (ms)；滑鼠事件仍在等待期間即時處理
+IDLE_WAIT_MS = 16
+
+# 共用的隱藏 Tk root（對話框的 parent），避免每次編輯 cell 都重建/銷毀 Tk
+_tk_root = None
+
+# cell 外框線寬；文字可能超出 cell 矩形的範圍（像素），裁切時需保留
+CELL_LINE_THICKNESS = 2
+TEXT_CULL_MARGIN = 200
+
+# 載入後把原圖轉成 BGRA（4 bytes/像素）。實測 INTER_NEAREST 較快，但 INTER_AREA/LINEAR
+# 反而較慢且多佔 1/3 記憶體，因此預設關閉。繪圖顏色一律用 4-tuple，兩種格式皆適用
+USE_BGRA = False
+
 # 顯示設定
 MAX_DISPLAY_WIDTH = 1600
 MAX_DISPLAY_HEIGHT = 900
 WINDOW_NAME = "Grid Annotator - Left: Select/Draw | Right: Pan | Wheel: Zoom | 's' to save"
 
-def redraw_image():
-    global display_image, zoom_factor, pan_offset_x, pan_offset_y
+def _mark_interactive():
+    global _interactive, _last_interaction_ts
+    _interactive = True
+    _last_interaction_ts = time.monotonic()
 
-    if original_image is None:
-        return
+def _settle_interactive():
+    """使用者停止操作一段時間後，以完整品質重繪"""
+    global _interactive
+    if _interactive and time.monotonic() - _last_interaction_ts >= INTERACTIVE_SETTLE_SEC:
+        _interactive = False
+        redraw_image()
+
+def _interpolation():
+    if _interactive:
+        return cv2.INTER_NEAREST
+    if zoom_factor < 1:
+        return cv2.INTER_AREA
+    return cv2.INTER_LINEAR
 
+def _blit_cached_scaled(canvas):
+    """縮小時：整張縮放圖很小，快取後平移只需切片複製"""
     scaled_width = int(original_image.shape[1] * zoom_factor)
     scaled_height = int(original_image.shape[0] * zoom_factor)
-    scaled_image = cv2.resize(original_image, (scaled_width, scaled_height), interpolation=cv2.INTER_LINEAR)
-
-    display_image = np.zeros((MAX_DISPLAY_HEIGHT, MAX_DISPLAY_WIDTH, 3), dtype=np.uint8)
+    interp = _interpolation()
+    # 互動中只要縮放倍率相同就沿用快取，不論當初的插值品質
+    if _scaled_cache["zoom"] == zoom_factor and (_interactive or _scaled_cache["interp"] == interp):
+        scaled_image = _scaled_cache["img"]
+    else:
+        if _original_umat is not None:
+            scaled_image = cv2.resize(_original_umat, (scaled_width, scaled_height), interpolation=interp).get()
+        else:
+            scaled_image = cv2.resize(original_image, (scaled_width, scaled_height), interpolation=interp)
+        _scaled_cache["zoom"] = zoom_factor
+        _scaled_cache["interp"] = interp
+        _scaled_cache["img"] = scaled_image
 
     src_x1 = max(0, int(-pan_offset_x))
     src_y1 = max(0, int(-pan_offset_y))
@@ -48,64 +119,198 @@ def redraw_image():
     dst_x2 = dst_x1 + (src_x2 - src_x1)
     dst_y2 = dst_y1 + (src_y2 - src_y1)
 
-    if src_x2 > src_x1 and src_y2 > src_y1:
-        display_image[dst_y1:dst_y2, dst_x1:dst_x2] = scaled_image[src_y1:src_y2, src_x1:src_x2]
+    if src_x2 <= src_x1 or src_y2 <= src_y1:
+        return None
+    canvas[dst_y1:dst_y2, dst_x1:dst_x2] = scaled_image[src_y1:src_y2, src_x1:src_x2]
+    return dst_x1, dst_y1, dst_x2, dst_y2
+
+def _blit_scaled_roi(canvas):
+    """放大時：先在原圖上裁出可視範圍，只 resize 這一小塊"""
+    h, w = original_image.shape[:2]
+
+    # 可視範圍對應的原圖座標（向外取整，避免視窗邊緣缺像素）
+    orig_x1 = max(0, math.floor(-pan_offset_x / zoom_factor))
+    orig_y1 = max(0, math.floor(-pan_offset_y / zoom_factor))
+    orig_x2 = min(w, math.ceil((MAX_DISPLAY_WIDTH - pan_offset_x) / zoom_factor))
+    orig_y2 = min(h, math.ceil((MAX_DISPLAY_HEIGHT - pan_offset_y) / zoom_factor))
+    if orig_x2 <= orig_x1 or orig_y2 <= orig_y1:
+        return None
+
+    # ROI 放大後在顯示座標中的完整矩形（可能超出視窗）
+    x1 = int(round(orig_x1 * zoom_factor + pan_offset_x))
+    y1 = int(round(orig_y1 * zoom_factor + pan_offset_y))
+    x2 = int(round(orig_x2 * zoom_factor + pan_offset_x))
+    y2 = int(round(orig_y2 * zoom_factor + pan_offset_y))
+
+    dst_x1, dst_y1 = max(0, x1), max(0, y1)
+    dst_x2, dst_y2 = min(MAX_DISPLAY_WIDTH, x2), min(MAX_DISPLAY_HEIGHT, y2)
+    if dst_x2 <= dst_x1 or dst_y2 <= dst_y1:
+        return None
+
+    roi = original_image[orig_y1:orig_y2, orig_x1:orig_x2]
+    interp = _interpolation()
+    if (dst_x1, dst_y1, dst_x2, dst_y2) == (x1, y1, x2, y2):
+        # 完全落在視窗內：直接寫入 canvas，不配置暫存
+        cv2.resize(roi, (x2 - x1, y2 - y1), dst=canvas[y1:y2, x1:x2], interpolation=interp)
+    else:
+        scaled_roi = cv2.resize(roi, (x2 - x1, y2 - y1), interpolation=interp)
+        canvas[dst_y1:dst_y2, dst_x1:dst_x2] = scaled_roi[dst_y1 - y1:dst_y2 - y1, dst_x1 - x1:dst_x2 - x1]
+    return dst_x1, dst_y1, dst_x2, dst_y2
+
+def _clear_outside(canvas, rect):
+    """只清除影像沒有覆蓋到的邊框區域"""
+    if rect is None:
+        canvas[:] = 0
+        return
+    x1, y1, x2, y2 = rect
+    canvas[:y1] = 0
+    canvas[y2:] = 0
+    canvas[y1:y2, :x1] = 0
+    canvas[y1:y2, x2:] = 0
+
+def redraw_image():
+    global _base_valid, _last_draw_ts, _redraw_pending
+
+    if original_image is None or display_image is None:
+        return
+
+    # display_image 於 main 中配置一次，每次重繪直接覆寫
+    if zoom_factor < 1:
+        rect = _blit_cached_scaled(display_image)
+    else:
+        rect = _blit_scaled_roi(display_image)
+    _clear_outside(display_image, rect)
 
     # Draw existing cells
-    for cell in cells:
-        draw_cell(display_image, cell)
+    draw_cells(display_image)
+
+    if _base_image is not None:
+        np.copyto(_base_image, display_image)
+        _base_valid = True
 
     cv2.imshow(WINDOW_NAME, display_image)
+    _last_draw_ts = time.monotonic()
+    _redraw_pending = False
 
-def draw_cell(image, cell):
-    # 使用 grid 座標系統計算位置
-    pixel_x, pixel_y = grid_to_pixel(cell.col, cell.row, grid_meta)
-    pixel_w = cell.unit_w * grid_meta["unit_w"]
-    pixel_h = cell.unit_h * grid_meta["unit_h"]
-    
-    # Transform to display coordinates
-    disp_x1 = int(pixel_x * zoom_factor + pan_offset_x)
-    disp_y1 = int(pixel_y * zoom_factor + pan_offset_y)
-    disp_x2 = int((pixel_x + pixel_w) * zoom_factor + pan_offset_x)
-    disp_y2 = int((pixel_y + pixel_h) * zoom_factor + pan_offset_y)
-
-    # 將線條粗細從 1 改為 2
-    cv2.rectangle(image, (disp_x1, disp_y1), (disp_x2, disp_y2), (0, 255, 0), 2)
-    
-    # Put text
+def _draw_bbox_preview(pt):
+    """在底圖快取上疊加框選中的暫時矩形"""
+    global _last_draw_ts, _pending_bbox_pt
+    if not _base_valid:
+        redraw_image()
+    np.copyto(display_image, _base_image)
+    cv2.rectangle(display_image, ref_point_display[0], pt, (0, 0, 255, 255), 2)
+    cv2.imshow(WINDOW_NAME, display_image)
+    _last_draw_ts = time.monotonic()
+    _pending_bbox_pt = None
+
+def _throttled(now):
+    return now - _last_draw_ts < MOUSEMOVE_MIN_INTERVAL
+
+def _flush_redraw():
+    """補畫被節流延後的重繪（平移或框選預覽）"""
+    global _pending_bbox_pt
+    if _redraw_pending:
+        redraw_image()
+    if _pending_bbox_pt is not None:
+        if drawing_bbox:
+            _draw_bbox_preview(_pending_bbox_pt)
+        else:
+            _pending_bbox_pt = None
+
+def _cell_display_rects():
+    """所有 cells 在顯示座標中的矩形 (N, 4) = [x1, y1, x2, y2]"""
+    # Transform cached pixel rects to display coordinates
+    offset = np.array([pan_offset_x, pan_offset_y, pan_offset_x, pan_offset_y], dtype=np.float64)
+    return (_cell_px * zoom_factor + offset).astype(np.int32)
+
+def draw_cells(image):
+    _ensure_cell_arrays()
+    if not cells:
+        return
+
+    rects = _cell_display_rects()
+    x1, y1, x2, y2 = rects.T
+
+    # 只畫與視窗相交的 cells（含線寬的餘量）
+    margin = CELL_LINE_THICKNESS
+    visible = ((x2 > -margin) & (x1 < MAX_DISPLAY_WIDTH + margin) &
+               (y2 > -margin) & (y1 < MAX_DISPLAY_HEIGHT + margin))
+    if visible.any():
+        # 所有矩形合併成一次 polylines 呼叫（角點順序與 cv2.rectangle 相同）
+        polys = rects[visible][:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 1, 2)
+        cv2.polylines(image, polys, True, (0, 255, 0, 255), CELL_LINE_THICKNESS)
+
+    # 文字可能延伸到矩形外，另以較大的範圍判斷
+    text_visible = ((np.maximum(x2, x1 + TEXT_CULL_MARGIN) > 0) & (x1 < MAX_DISPLAY_WIDTH) &
+                    (np.maximum(y2, y1 + TEXT_CULL_MARGIN) > 0) & (y1 < MAX_DISPLAY_HEIGHT))
+    for i in np.flatnonzero(text_visible):
+        draw_cell_text(image, cells[i], int(x1[i]), int(y1[i]))
+
+def draw_cell_text(image, cell, disp_x1, disp_y1):
     text = f"{cell.idx}:{cell.type}({cell.col},{cell.row})"
     # 將文字顏色改為黑色 (0, 0, 0)，字體粗細改為 2
-    cv2.putText(image, text, (disp_x1 + 5, disp_y1 + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 2)
+    cv2.putText(image, text, (disp_x1 + 5, disp_y1 + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0, 255), 2)
+
 
+def _mark_cells_dirty():
+    global _cells_dirty
+    _cells_dirty = True
+
+def _rebuild_cell_arrays():
+    global _cell_arr, _idx_map, _cell_px, _cells_dirty
+    _cell_arr = cells_to_array(cells)
+    _idx_map = build_idx_map(cells)
+    # 使用 grid 座標系統計算位置
+    pixel_x, pixel_y = grid_to_pixel_vec(_cell_arr["col"], _cell_arr["row"], grid_meta)
+    _cell_px = np.empty((len(_cell_arr), 4), dtype=np.float64)
+    _cell_px[:, 0] = pixel_x
+    _cell_px[:, 1] = pixel_y
+    _cell_px[:, 2] = pixel_x + _cell_arr["unit_w"] * grid_meta["unit_w"]
+    _cell_px[:, 3] = pixel_y + _cell_arr["unit_h"] * grid_meta["unit_h"]
+    _cells_dirty = False
+
+def _ensure_cell_arrays():
+    if _cells_dirty:
+        _rebuild_cell_arrays()
 
 def get_cell_at_coords(x_disp, y_disp):
     """Find which cell is at the clicked display coordinates."""
+    _ensure_cell_arrays()
+
     # Convert display coordinates to original image coordinates
     orig_x = (x_disp - pan_offset_x) / zoom_factor
     orig_y = (y_disp - pan_offset_y) / zoom_factor
 
-    for cell in reversed(cells): # Search from top-most rendered
-        if cell.x <= orig_x < (cell.x + cell.w) and cell.y <= orig_y < (cell.y + cell.h):
-            return cell
+    bx, by, bw, bh = _cell_arr["x"], _cell_arr["y"], _cell_arr["w"], _cell_arr["h"]
+    mask = (bx <= orig_x) & (orig_x < bx + bw) & (by <= orig_y) & (orig_y < by + bh)
+    hits = np.flatnonzero(mask)
+    if hits.size:
+        return cells[hits[-1]] # Last match is the top-most rendered
     return None
 
+def _get_tk_root():
+    global _tk_root
+    if _tk_root is None:
+        _tk_root = tk.Tk()
+        _tk_root.withdraw() # Hide the main window
+    return _tk_root
+
 def edit_cell_dialog(cell):
     """Opens a dialog to edit cell properties or delete."""
-    root = tk.Tk()
-    root.withdraw() # Hide the main window
+    root = _get_tk_root()
 
     response = messagebox.askyesnocancel(
         "Edit/Delete Cell",
         f"編輯 Cell {cell.idx} (Type: {cell.type}, Name: {cell.name or '無'})\n\n按下 '是' 編輯，'否' 刪除，'取消' 關閉。",
-        icon='question'
+        icon='question', parent=root
     )
 
     if response is True: # Yes, edit
-        new_type = simpledialog.askstring("Edit Cell", "Enter new type:", initialvalue=cell.type)
+        new_type = simpledialog.askstring("Edit Cell", "Enter new type:", initialvalue=cell.type, parent=root)
         if new_type is not None:
             cell.type = new_type
         
-        new_name = simpledialog.askstring("Edit Cell", "Enter new name:", initialvalue=cell.name or "")
+        new_name = simpledialog.askstring("Edit Cell", "Enter new name:", initialvalue=cell.name or "", parent=root)
         if new_name is not None:
             cell.name = new_name if new_name else None
         
@@ -113,18 +318,22 @@ def edit_cell_dialog(cell):
         # For now, these are derived from initial bboxes or manual drawing.
         
     elif response is False: # No, delete
-        if messagebox.askyesno("Confirm Delete", f"確定要刪除 Cell {cell.idx} 嗎？", icon='warning'):
-            global cells
-            cells = [c for c in cells if c.idx != cell.idx]
-            messagebox.showinfo("Deleted", f"Cell {cell.idx} 已刪除。")
+        if messagebox.askyesno("Confirm Delete", f"確定要刪除 Cell {cell.idx} 嗎？", icon='warning', parent=root):
+            _ensure_cell_arrays()
+            pos = _idx_map.get(cell.idx)
+            if pos is not None:
+                del cells[pos]
+            _mark_cells_dirty()
+            messagebox.showinfo("Deleted", f"Cell {cell.idx} 已刪除。", parent=root)
     
     # Redraw in any case to reflect changes (or lack thereof)
     redraw_image()
-    root.destroy()
+    root.update() # 沒有 mainloop，手動處理已關閉對話框的事件
 
 def mouse_callback(event, x, y, flags, param):
     global ref_point_display, drawing_bbox, panning, start_pan_x, start_pan_y
     global zoom_factor, pan_offset_x, pan_offset_y, next_idx
+    global _redraw_pending, _pending_bbox_pt
 
     if event == cv2.EVENT_LBUTTONDOWN:
         clicked_cell = get_cell_at_coords(x, y)
@@ -135,6 +344,7 @@ def mouse_callback(event, x, y, flags, param):
             drawing_bbox = True
 
     elif event == cv2.EVENT_LBUTTONUP:
+        _flush_redraw()
         if drawing_bbox:
             drawing_bbox = False
             ref_point_display.append((x, y))
@@ -172,15 +382,18 @@ def mouse_callback(event, x, y, flags, param):
                 unit_w=unit_w, unit_h=unit_h
             )
             cells.append(new_cell)
+            _mark_cells_dirty()
             next_idx += 1
             edit_cell_dialog(new_cell) # Open dialog for the new cell
 
     elif event == cv2.EVENT_RBUTTONDOWN:
         panning = True
         start_pan_x, start_pan_y = x, y
+        _mark_interactive()
 
     elif event == cv2.EVENT_RBUTTONUP:
         panning = False
+        _flush_redraw()
 
     elif event == cv2.EVENT_MOUSEWHEEL:
         old_zoom = zoom_factor
@@ -190,33 +403,54 @@ def mouse_callback(event, x, y, flags, param):
         
         pan_offset_x = x - (x - pan_offset_x) * (zoom_factor / old_zoom)
         pan_offset_y = y - (y - pan_offset_y) * (zoom_factor / old_zoom)
+        _mark_interactive()
         redraw_image()
 
     elif event == cv2.EVENT_MOUSEMOVE: # Corrected: single MOUSEMOVE check
+        now = time.monotonic()
         if drawing_bbox:
-            temp_display_image = display_image.copy()
-            cv2.rectangle(temp_display_image, ref_point_display[0], (x, y), (0, 0, 255), 2)
-            cv2.imshow(WINDOW_NAME, temp_display_image)
+            if _throttled(now):
+                _pending_bbox_pt = (x, y)
+            else:
+                _draw_bbox_preview((x, y))
         elif panning: # Now correctly an elif inside MOUSEMOVE block
             dx = x - start_pan_x
             dy = y - start_pan_y
             pan_offset_x += dx
             pan_offset_y += dy
             start_pan_x, start_pan_y = x, y
-            redraw_image()
+            _mark_interactive()
+            if _throttled(now):
+                _redraw_pending = True
+            else:
+                redraw_image()
 
 
 def main(image_path, grid_path):
-    global original_image, cells, next_idx, zoom_factor, pan_offset_x, pan_offset_y, grid_meta
+    global original_image, display_image, _base_image, _base_valid, cells, next_idx, zoom_factor, pan_offset_x, pan_offset_y, grid_meta
+    global _tk_root, _original_umat
 
     original_image = cv2.imread(image_path)
     if original_image is None:
         print(f"Error: Cannot load image at {image_path}")
         return
+    # 每列像素連續才走 cv2 的 SIMD 路徑；ROI 切片只跳列 (row step)，cv2 可直接處理不需複製
+    if USE_BGRA:
+        original_image = cv2.cvtColor(original_image, cv2.COLOR_BGR2BGRA)
+    elif not original_image.flags.c_contiguous:
+        original_image = np.ascontiguousarray(original_image)
+    _original_umat = cv2.UMat(original_image) if cv2.ocl.haveOpenCL() else None
+    _scaled_cache["zoom"] = None
+    _scaled_cache["interp"] = None
+    _scaled_cache["img"] = None
+    display_image = np.empty((MAX_DISPLAY_HEIGHT, MAX_DISPLAY_WIDTH, original_image.shape[2]), dtype=np.uint8)
+    _base_image = np.empty_like(display_image)
+    _base_valid = False
 
     # 載入 grid 和 meta 資料
     cells = load_grid(grid_path)
     grid_meta = load_grid_meta(grid_path.replace('grid.json', 'grid_meta.json'))
+    _mark_cells_dirty()
     print(f"Grid meta: {grid_meta}")
     
     if cells:
@@ -232,11 +466,15 @@ def main(image_path, grid_path):
     cv2.namedWindow(WINDOW_NAME, cv2.WINDOW_NORMAL)
     cv2.resizeWindow(WINDOW_NAME, MAX_DISPLAY_WIDTH, MAX_DISPLAY_HEIGHT)
     cv2.setMouseCallback(WINDOW_NAME, mouse_callback)
+    _get_tk_root() # 啟動時先建立，第一次編輯不必等待 Tk 初始化
 
     redraw_image()
 
     while True:
-        key = cv2.waitKey(1) & 0xFF
+        # 先補畫節流延後的畫面，再讓出 CPU 等待事件（約 60 Hz）
+        _flush_redraw()
+        _settle_interactive()
+        key = cv2.waitKey(IDLE_WAIT_MS) & 0xFF
         if key == ord('q'):
             break
         elif key == ord('s'):
@@ -244,6 +482,9 @@ def main(image_path, grid_path):
             print(f"Grid saved to {grid_path}")
             
     cv2.destroyAllWindows()
+    if _tk_root is not None:
+        _tk_root.destroy()
+        _tk_root = None
 
 if __name__ == "__main__":
     import argparse
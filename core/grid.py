@@ -1,9 +1,14 @@
 import json
-from dataclasses import dataclass, field, asdict
-from typing import List, Optional
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
 import numpy as np
 import cv2
 
+try:
+    import orjson  # 選用：C 實作的 JSON，載入/儲存 grid 較快
+except ImportError:
+    orjson = None
+
 @dataclass
 class Cell:
     """Represents a single cell in the grid."""
@@ -23,6 +28,12 @@ class Cell:
     name: Optional[str] = None
     booth_id: Optional[str] = None
 
+# Cell 數值欄位的 SoA 表示；字串欄位 (type/name/booth_id) 長度不固定，仍留在 Cell 上
+CELL_DTYPE = np.dtype([
+    ("idx", "i4"), ("col", "i4"), ("row", "i4"), ("unit_w", "i4"), ("unit_h", "i4"),
+    ("x", "i4"), ("y", "i4"), ("w", "i4"), ("h", "i4"),
+])
+
 def_colors = {
     "booth": (128, 208, 128),      # Light green
     "walkway": (221, 221, 221),    # Light grey
@@ -35,57 +46,96 @@ def_colors = {
 def load_grid(path: str = "data/grid.json") -> List[Cell]:
     """Loads grid data from a JSON file."""
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return [Cell(**item) for item in data]
+        with open(path, 'rb') as f:
+            raw = f.read()
     except FileNotFoundError:
         return []
+    data = orjson.loads(raw) if orjson is not None else json.loads(raw.decode('utf-8'))
+    return [Cell(**item) for item in data]
 
-def save_grid(cells: List[Cell], path: str = "data/grid.json"):
-    """Saves grid data to a JSON file."""
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump([asdict(c) for c in cells], f, indent=4)
+def save_grid(cells: List[Cell], path: str = "data/grid.json", compact: bool = False):
+    """Saves grid data to a JSON file (indent=4 by default; compact=True writes one compact UTF-8 line)."""
+    # 數值欄位經 SoA 一次 tolist() 轉成 Python int，避免逐格 asdict 的遞迴複製
+    numeric = cells_to_array(cells).tolist()
+    data = [
+        {"idx": idx, "x": x, "y": y, "w": w, "h": h,
+         "col": col, "row": row, "unit_w": unit_w, "unit_h": unit_h,
+         "type": c.type, "name": c.name, "booth_id": c.booth_id}
+        for c, (idx, col, row, unit_w, unit_h, x, y, w, h) in zip(cells, numeric)
+    ]
+    # 預設維持與版控中 data/grid.json 相同的 indent=4 格式，避免每次儲存都產生整檔 diff
+    with open(path, 'wb') as f:
+        if not compact:
+            f.write(json.dumps(data, indent=4).encode('utf-8'))
+        elif orjson is not None:
+            f.write(orjson.dumps(data))
+        else:
+            f.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+def cells_to_array(cells: List[Cell]) -> np.ndarray:
+    """Packs the numeric fields of cells into a CELL_DTYPE structured array (same order)."""
+    return np.array(
+        [(c.idx, c.col, c.row, c.unit_w, c.unit_h, c.x, c.y, c.w, c.h) for c in cells],
+        dtype=CELL_DTYPE
+    )
 
-def get_by_idx(cells: List[Cell], idx: int) -> Optional[Cell]:
-    """Finds a cell by its index."""
+def build_idx_map(cells: List[Cell]) -> Dict[int, int]:
+    """Builds an idx -> list position map for O(1) lookups."""
+    return {c.idx: i for i, c in enumerate(cells)}
+
+def get_by_idx(cells: List[Cell], idx: int, idx_map: Optional[Dict[int, int]] = None) -> Optional[Cell]:
+    """Finds a cell by its index (O(1) when an up-to-date idx_map is given)."""
+    if idx_map is not None:
+        pos = idx_map.get(idx)
+        return cells[pos] if pos is not None else None
     for cell in cells:
         if cell.idx == idx:
             return cell
     return None
 
-def overlay_grid(image: np.ndarray, cells: List[Cell], show_idx: bool = True, color_map: dict = None) -> np.ndarray:
+def overlay_grid(image: np.ndarray, cells: List[Cell], show_idx: bool = True, color_map: dict = None,
+                 inplace: bool = False) -> np.ndarray:
     """
     Draws the grid overlay on an image.
-    Returns a new image with the overlay.
+    Returns a new image with the overlay; with inplace=True draws directly on
+    `image` and returns it (no full-image copy, the caller's buffer is modified).
     """
     if color_map is None:
         color_map = def_colors
 
-    overlay = image.copy()
-    
-    for cell in cells:
+    overlay = image if inplace else image.copy()
+    if not cells:
+        return overlay
+
+    arr = cells_to_array(cells)
+    x1, y1 = arr["x"], arr["y"]
+    x2, y2 = x1 + arr["w"], y1 + arr["h"]
+    # 每格四個角 (順序同 cv2.rectangle)，依顏色分組後每組一次 polylines
+    polys = np.stack([x1, y1, x2, y1, x2, y2, x1, y2], axis=1).astype(np.int32).reshape(-1, 4, 1, 2)
+
+    groups: Dict[tuple, List[int]] = {}
+    for i, cell in enumerate(cells):
         color = color_map.get(cell.type, (0, 0, 255)) # Default to red if type not in map
-        top_left = (cell.x, cell.y)
-        bottom_right = (cell.x + cell.w, cell.y + cell.h)
-        
-        # Draw rectangle
-        cv2.rectangle(overlay, top_left, bottom_right, color, 2)
-        
-        if show_idx:
-            # Put text (idx) in the center of the box
+        groups.setdefault(tuple(color), []).append(i)
+    for color, members in groups.items():
+        cv2.polylines(overlay, polys[members], True, color, 2)
+
+    if show_idx:
+        # 框線畫完後再統一寫 idx 文字 (置中)
+        for cell, cx, cy, cw, ch in zip(cells, x1.tolist(), y1.tolist(), arr["w"].tolist(), arr["h"].tolist()):
             text = str(cell.idx)
             text_size = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0]
-            text_x = cell.x + (cell.w - text_size[0]) // 2
-            text_y = cell.y + (cell.h + text_size[1]) // 2
+            text_x = cx + (cw - text_size[0]) // 2
+            text_y = cy + (ch + text_size[1]) // 2
             cv2.putText(overlay, text, (text_x, text_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1, cv2.LINE_AA)
-            
-    return overlay 
+
+    return overlay
 
 def load_grid_meta(path: str = "data/grid_meta.json") -> dict:
     """Loads grid metadata (unit size, origin, etc.)"""
     try:
         with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+            meta = json.load(f)
     except FileNotFoundError:
         # 預設值
         return {
@@ -94,6 +144,11 @@ def load_grid_meta(path: str = "data/grid_meta.json") -> dict:
             "origin_x": 0,
             "origin_y": 0
         }
+    # grid 座標換算走整數運算，這幾個欄位必須是整數
+    for key in ("unit_w", "unit_h", "origin_x", "origin_y"):
+        if not isinstance(meta.get(key), int):
+            raise ValueError(f"grid meta '{key}' must be an integer, got {meta.get(key)!r}")
+    return meta
 
 def grid_to_pixel(col, row, meta):
     """Convert grid coordinates to pixel coordinates"""
@@ -103,8 +158,25 @@ def grid_to_pixel(col, row, meta):
     )
 
 def pixel_to_grid(x, y, meta):
-    """Convert pixel coordinates to grid coordinates"""
+    """Convert pixel coordinates to grid coordinates (nearest, ties round up)"""
+    # round(d / u) 改寫成 floor((2d + u) / 2u)：整數輸入全程整數運算，負數也正確
+    uw, uh = meta["unit_w"], meta["unit_h"]
+    return (
+        int((2 * (x - meta["origin_x"]) + uw) // (2 * uw)),
+        int((2 * (y - meta["origin_y"]) + uh) // (2 * uh))
+    )
+
+def grid_to_pixel_vec(cols: np.ndarray, rows: np.ndarray, meta: dict):
+    """Vectorized grid_to_pixel for arrays of cols/rows."""
     return (
-        round((x - meta["origin_x"]) / meta["unit_w"]),
-        round((y - meta["origin_y"]) / meta["unit_h"])
-    ) 
\ No newline at end of file
+        meta["origin_x"] + np.asarray(cols) * meta["unit_w"],
+        meta["origin_y"] + np.asarray(rows) * meta["unit_h"]
+    )
+
+def pixel_to_grid_vec(xs: np.ndarray, ys: np.ndarray, meta: dict):
+    """Vectorized pixel_to_grid (same integer (2d + u) // 2u rounding)."""
+    uw, uh = meta["unit_w"], meta["unit_h"]
+    return (
+        ((2 * (np.asarray(xs) - meta["origin_x"]) + uw) // (2 * uw)).astype(np.int32),
+        ((2 * (np.asarray(ys) - meta["origin_y"]) + uh) // (2 * uh)).astype(np.int32)
+    )
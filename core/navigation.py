@@ -7,16 +7,69 @@
 - Rule Formatter: 中文導航文字生成
 """
 
+import heapq
 import json
 import math
 import os
 import sys
 import yaml
+from collections import OrderedDict
+from operator import attrgetter
+import numpy as np
 from typing import List, Dict, Tuple, Optional, Union
 from dataclasses import dataclass
 from pathlib import Path
 
-@dataclass
+try:
+    from yaml import CSafeLoader as YamlLoader  # libyaml C 實作
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+try:
+    import orjson  # 選用：C 實作的 JSON，輸出導航步驟較快
+except ImportError:
+    orjson = None
+
+# 已解析的 YAML 配置：(絕對路徑, mtime) -> dict，批次執行時避免重複解析
+_config_cache = {}
+
+# 已解析的 JSON 資料（grid / grid_types / 路徑檔）：(絕對路徑, mtime) -> 物件，LRU 保留最近幾個檔案
+_json_cache = OrderedDict()
+JSON_CACHE_SIZE = 8
+
+
+def _load_json(path: str):
+    """
+    讀取並解析 JSON 檔（有 orjson 時使用 orjson），依路徑與 mtime 快取
+
+    回傳的物件在多個呼叫端之間共用，呼叫端不應就地修改。
+    """
+    cache_key = (os.path.abspath(path), os.path.getmtime(path))
+    data = _json_cache.get(cache_key)
+    if data is None:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw.decode('utf-8'))
+        _json_cache[cache_key] = data
+        if len(_json_cache) > JSON_CACHE_SIZE:
+            _json_cache.popitem(last=False)
+    else:
+        _json_cache.move_to_end(cache_key)
+    return data
+
+try:
+    from numba import njit  # 選用：JIT 編譯轉向/方位等小型數值核心
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """沒有 numba 時的替代裝飾器：直接回傳原函式"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+@dataclass(slots=True)
 class NavigationConfig:
     """導航系統配置"""
     
@@ -57,8 +110,12 @@ class NavigationConfig:
         if not os.path.exists(yaml_file):
             raise FileNotFoundError(f"配置文件不存在: {yaml_file}")
         
-        with open(yaml_file, 'r', encoding='utf-8') as f:
-            config_data = yaml.safe_load(f)
+        cache_key = (os.path.abspath(yaml_file), os.path.getmtime(yaml_file))
+        config_data = _config_cache.get(cache_key)
+        if config_data is None:
+            with open(yaml_file, 'r', encoding='utf-8') as f:
+                config_data = yaml.load(f, Loader=YamlLoader)
+            _config_cache[cache_key] = config_data
         
         # 創建配置實例
         config = cls()
@@ -101,23 +158,142 @@ except ImportError:
     from core.pathfinder import RouteResult
 
 
-@dataclass
+# 數值核心以整數代碼回傳，由 RouteAnalyzer 的方法轉回字串
+TURN_NAMES = {1: "right", -1: "left", 0: "straight"}
+SIDE_NAMES = ("front", "left", "right", "behind", "unknown")
+SIDE_FRONT, SIDE_LEFT, SIDE_RIGHT, SIDE_BEHIND, SIDE_UNKNOWN = range(len(SIDE_NAMES))
+DIRECTION_NAMES = ("east", "west", "south", "north")
+# 轉彎點附近地標的排序優先級：front > left/right > behind > unknown
+SIDE_PRIORITY = {"front": 0, "left": 1, "right": 1, "behind": 2, "unknown": 3}
+
+# units -> 攤位數的查表（units 為路徑上的小整數，超出範圍時才現算）
+BOOTH_COUNT_LUT = tuple(max(1, round(units / 2.5)) for units in range(4096))
+
+# RuleFormatter 的方位 / 動作文字（模組常數，避免每次呼叫重建 dict）
+SIDE_TEXT = {"left": "左手邊", "right": "右手邊", "front": "前方", "behind": "後方"}
+ACTION_TEXT = {
+    "orient": "面向",
+    "turn_left": "左轉",
+    "turn_right": "右轉",
+    "continue": "繼續直走",
+    "arrive": "到達目的地"
+}
+
+# analyze_route 的直線段表：路徑索引範圍、端點、方向向量、Chebyshev 長度、方向代碼
+SEGMENT_DTYPE = np.dtype([
+    ("i0", "i4"), ("i1", "i4"), ("sx", "i4"), ("sy", "i4"), ("ex", "i4"), ("ey", "i4"),
+    ("dx", "i4"), ("dy", "i4"), ("length", "i4"), ("dir_code", "i1"),
+])
+
+# 每個 RouteAnalyzer 保留的中繼地標搜尋結果數量
+LANDMARK_CACHE_SIZE = 4096
+# 每個 RouteAnalyzer 保留的三序列結果數量
+THREE_SEQ_CACHE_SIZE = 2048
+
+# 序列選擇第一階段參與比較的序列
+PRIMARY_SEQUENCE_NAMES = ("crossing", "left", "right")
+
+# 序列評分時取覆蓋率（C 層 attrgetter，省去 lambda 呼叫）
+COVERAGE_OF = attrgetter('coverage_ratio')
+
+
+@njit(cache=True)
+def _turn_dir_nb(x1, y1, x2, y2, x3, y3):
+    """外積判斷轉向：1=右, -1=左, 0=直行（row 軸向下）"""
+    cross_product = (x2 - x1) * (y3 - y2) - (y2 - y1) * (x3 - x2)
+    if cross_product > 0:
+        return 1
+    elif cross_product < 0:
+        return -1
+    return 0
+
+
+# 前方判斷的 cos 門檻平方：cos(45°) ≈ 0.707、cos(15°) ≈ 0.966
+FRONT_COS_SQ_45 = 0.707 * 0.707
+FRONT_COS_SQ_15 = 0.966 * 0.966
+
+
+@njit(cache=True)
+def _side_nb(mx, my, lx, ly, front_cos_sq):
+    """地標方向 (lx, ly) 相對移動方向 (mx, my) 的方位代碼，對應 SIDE_NAMES"""
+    move_sq = mx * mx + my * my
+    landmark_sq = lx * lx + ly * ly
+    if move_sq == 0 or landmark_sq == 0:
+        return 4
+    # 內積判斷前後：dot / (|m||l|) >= cos 改寫成平方比較，免開根號與除法
+    dot = mx * lx + my * ly
+    if dot > 0 and dot * dot >= front_cos_sq * (move_sq * landmark_sq):
+        return 0
+    # 外積判斷左右（修正座標系）
+    cross = mx * ly - my * lx
+    if cross > 0:
+        return 2
+    elif cross < 0:
+        return 1
+    return 3
+
+
+def _side_codes(mx, my, lx, ly, front_cos_sq):
+    """_side_nb 的陣列版本：同一移動方向下一次算出多個地標方向 (lx, ly) 的方位代碼"""
+    move_sq = mx * mx + my * my
+    landmark_sq = lx * lx + ly * ly
+    dot = mx * lx + my * ly
+    cross = mx * ly - my * lx
+    return np.select(
+        [(landmark_sq == 0) | (move_sq == 0),
+         (dot > 0) & (dot * dot >= front_cos_sq * (move_sq * landmark_sq)),
+         cross > 0, cross < 0],
+        [SIDE_UNKNOWN, SIDE_FRONT, SIDE_RIGHT, SIDE_LEFT], SIDE_BEHIND)
+
+
+@njit(cache=True)
+def _direction_nb(dx, dy):
+    """主要移動方向代碼，對應 DIRECTION_NAMES"""
+    if abs(dx) > abs(dy):
+        return 0 if dx > 0 else 1
+    return 2 if dy > 0 else 3
+
+
+def _segment_samples(start: int, delta: int, length: int) -> np.ndarray:
+    """
+    路段 start -> start + delta 上 length + 1 個取樣點的單軸整數座標
+    
+    等同 int(start + i / length * delta)（往 0 截斷），但全程整數運算，
+    不會因浮點誤差少算一格（例如 15 / 22 * 22 = 14.999...）。
+    """
+    num = start * length + np.arange(length + 1, dtype=np.int64) * delta
+    return np.where(num >= 0, num // length, -((-num) // length))
+
+
+if HAVE_NUMBA:
+    # import 時先各呼叫一次，把 JIT（或快取載入）成本移出第一次導航
+    _turn_dir_nb(0, 0, 1, 0, 1, 1)
+    _side_nb(1, 0, 0, 1, FRONT_COS_SQ_45)
+    _direction_nb(1, 0)
+
+
+@dataclass(slots=True)
 class LandmarkInfo:
     """地標資訊"""
     idx: int
     name: str
     side: str  # "left", "right", "front", "behind"
 
-@dataclass
+@dataclass(slots=True)
 class LandmarkWithCoverage:
     """帶覆蓋率的地標資訊"""
     cell: Dict
     side: str
     coverage_ratio: float  # 覆蓋率 (0.0 - 1.0)
     path_positions: List[int]  # 在路徑上出現的位置列表
+    side_code: int = None  # side 的整數代碼（SIDE_NAMES 索引），未給定時由 side 推得
+    
+    def __post_init__(self):
+        if self.side_code is None:
+            self.side_code = SIDE_NAMES.index(self.side) if self.side in SIDE_NAMES else len(SIDE_NAMES)
 
 
-@dataclass
+@dataclass(slots=True)
 class NavigationStep:
     """單一導航步驟"""
     step_id: int
@@ -146,16 +322,128 @@ class RouteAnalyzer:
         # 建立索引映射
         self.idx_to_cell = {cell['idx']: cell for cell in grid_data}
         
-        # 建立 unit 座標到 cell 的映射（用於地標搜尋）
-        self.unit_to_cells = {}
+        # 以 cell idx 索引的「好地標」遮罩與地標優先級，避免在搜尋迴圈中重複做字串判斷
+        size = max(self.idx_to_cell) + 1 if self.idx_to_cell else 0
+        self.good_landmark_mask = np.zeros(size, dtype=bool)
+        self.landmark_priority = np.zeros(size, dtype=np.int64)
+        self.large_landmark_mask = np.zeros(size, dtype=bool)
         for cell in grid_data:
-            # 計算該 cell 佔據的所有 unit 座標
-            for row_offset in range(cell.get('unit_h', 1)):
-                for col_offset in range(cell.get('unit_w', 1)):
-                    unit_pos = (cell['col'] + col_offset, cell['row'] + row_offset)
-                    if unit_pos not in self.unit_to_cells:
-                        self.unit_to_cells[unit_pos] = []
-                    self.unit_to_cells[unit_pos].append(cell)
+            self.good_landmark_mask[cell['idx']] = self.is_landmark(cell) and self.is_good_landmark(cell)
+            self.landmark_priority[cell['idx']] = self.get_landmark_priority(cell)
+            self.large_landmark_mask[cell['idx']] = cell.get('type') in ('exp hall', 'stage', 'Lounge')
+        
+        # 中繼地標搜尋結果的 LRU 快取（同一路段常被重複查詢）
+        self._landmark_cache = OrderedDict()
+        # 長路段序列選擇結果的 LRU 快取（批次生成同起點路線時同一路段反覆出現）
+        self._sequence_cache = OrderedDict()
+        self._three_seq_cache = OrderedDict()
+        # 各搜尋半徑的鄰域偏移表（依半徑快取）
+        self._offset_cache = {}
+        
+        # 建立 unit 座標到 cell 的映射（用於地標搜尋）
+        self._build_unit_index()
+        self._build_landmark_grid()
+    
+    def _build_unit_index(self):
+        """
+        以 CSR 結構建立 unit 座標 -> cells 的索引
+        
+        unit (col, row) 的 flat = (row - row0) * W + (col - col0)，
+        其 cells 為 grid_data[cell_indices[cell_offsets[flat]:cell_offsets[flat + 1]]]，
+        同一 unit 內維持 grid_data 順序。
+        """
+        if self.grid_data:
+            col0 = min(cell['col'] for cell in self.grid_data)
+            row0 = min(cell['row'] for cell in self.grid_data)
+            width = max(cell['col'] + cell.get('unit_w', 1) for cell in self.grid_data) - col0
+            height = max(cell['row'] + cell.get('unit_h', 1) for cell in self.grid_data) - row0
+        else:
+            col0 = row0 = width = height = 0
+        
+        # 柵格化：每個 cell 以切片一次寫入其佔據的 unit 範圍（重疊時後寫者勝），
+        # 同時收集各 unit 的 flat 索引供 CSR 使用（重疊的 cell 都保留）
+        self.cell_grid = np.full((height, width), -1, dtype=np.int32)
+        flats, positions = [], []
+        for pos, cell in enumerate(self.grid_data):
+            c, r = cell['col'] - col0, cell['row'] - row0
+            h, w = cell.get('unit_h', 1), cell.get('unit_w', 1)
+            self.cell_grid[r:r + h, c:c + w] = cell['idx']
+            footprint = (np.arange(r, r + h)[:, None] * width + np.arange(c, c + w)).ravel()
+            flats.append(footprint)
+            positions.append(np.full(len(footprint), pos, dtype=np.int32))
+        
+        flats = np.concatenate(flats) if flats else np.empty(0, dtype=np.int64)
+        positions = np.concatenate(positions) if positions else np.empty(0, dtype=np.int32)
+        counts = np.bincount(flats, minlength=width * height)
+        self._unit_origin = (col0, row0)
+        self._unit_shape = (height, width)
+        self.cell_offsets = np.zeros(width * height + 1, dtype=np.int32)
+        np.cumsum(counts, out=self.cell_offsets[1:])
+        # 穩定排序 = 依 grid_data 順序逐一寫入各 unit 的區段
+        self.cell_indices = positions[np.argsort(flats, kind='stable')]
+        self._cell_idx = np.array([cell['idx'] for cell in self.grid_data], dtype=np.int64)
+    
+    def _offsets(self, radius: int) -> np.ndarray:
+        """取得半徑 radius 的方形鄰域偏移 (dx, dy)，dx 外層、dy 內層，不含中心點"""
+        offsets = self._offset_cache.get(radius)
+        if offsets is None:
+            grid = np.mgrid[-radius:radius + 1, -radius:radius + 1].reshape(2, -1).T
+            offsets = grid[(grid[:, 0] != 0) | (grid[:, 1] != 0)]
+            offsets.flags.writeable = False
+            self._offset_cache[radius] = offsets
+        return offsets
+    
+    def _cells_at(self, unit_pos: Tuple[int, int]) -> List[Dict]:
+        """取得覆蓋某 unit 座標的所有 cells（無則為空列表）"""
+        col = unit_pos[0] - self._unit_origin[0]
+        row = unit_pos[1] - self._unit_origin[1]
+        height, width = self._unit_shape
+        if not (0 <= col < width and 0 <= row < height) or self.cell_grid[row, col] < 0:
+            return []
+        flat = row * width + col
+        start, end = self.cell_offsets[flat], self.cell_offsets[flat + 1]
+        return [self.grid_data[k] for k in self.cell_indices[start:end]]
+    
+    def _build_landmark_grid(self):
+        """
+        建立「好地標」的稠密 unit 網格，供中繼地標搜尋做向量化查表
+        
+        landmark_grid[layer, row - row0, col - col0] = 地標 slot（-1 為空），
+        同一 unit 被多個地標覆蓋時依 grid_data 順序放在不同 layer。
+        slot 對應 self._lm_cells / self._lm_idx。
+        """
+        self._lm_cells = [cell for cell in self.grid_data if self.good_landmark_mask[cell['idx']]]
+        self._lm_idx = np.array([cell['idx'] for cell in self._lm_cells], dtype=np.int64)
+        self._lm_pos = np.array([(cell['col'], cell['row']) for cell in self._lm_cells],
+                                dtype=np.int64).reshape(-1, 2)
+        
+        if not self._lm_cells:
+            self._lm_origin = (0, 0)
+            self.landmark_grid = np.full((1, 0, 0), -1, dtype=np.int32)
+            return
+        
+        col0 = min(cell['col'] for cell in self._lm_cells)
+        row0 = min(cell['row'] for cell in self._lm_cells)
+        width = max(cell['col'] + cell.get('unit_w', 1) for cell in self._lm_cells) - col0
+        height = max(cell['row'] + cell.get('unit_h', 1) for cell in self._lm_cells) - row0
+        
+        depth = np.zeros((height, width), dtype=np.int32)
+        for cell in self._lm_cells:
+            c, r = cell['col'] - col0, cell['row'] - row0
+            depth[r:r + cell.get('unit_h', 1), c:c + cell.get('unit_w', 1)] += 1
+        
+        grid = np.full((max(1, int(depth.max())), height, width), -1, dtype=np.int32)
+        depth[:] = 0
+        for slot, cell in enumerate(self._lm_cells):
+            c, r = cell['col'] - col0, cell['row'] - row0
+            h, w = cell.get('unit_h', 1), cell.get('unit_w', 1)
+            # 每個 unit 寫到目前的下一個空 layer
+            rows, cols = np.mgrid[r:r + h, c:c + w]
+            grid[depth[r:r + h, c:c + w], rows, cols] = slot
+            depth[r:r + h, c:c + w] += 1
+        
+        self._lm_origin = (col0, row0)
+        self.landmark_grid = grid
     
     def is_landmark(self, cell: Dict) -> bool:
         """判斷格子是否為地標（支援多種類型）"""
@@ -225,6 +513,57 @@ class RouteAnalyzer:
         if search_radius is None:
             search_radius = self.config.landmark_detection["search_radius"]
         
+        landmarks, _ = self._cached_landmarks(start_pos, end_pos, search_radius, exclude_cell_ids)
+        
+        # 呼叫端會就地排序回傳的列表，因此每次給新的 list
+        return list(landmarks)
+    
+    def best_intermediate_landmark(self, start_pos: Tuple[int, int], 
+                                   end_pos: Tuple[int, int], 
+                                   exclude_cell_ids: set = None) -> Optional[LandmarkWithCoverage]:
+        """覆蓋率最高的中繼地標（同覆蓋率取搜尋順序較前者），沒有則回傳 None"""
+        landmarks, coverage = self._cached_landmarks(
+            start_pos, end_pos, self.config.landmark_detection["search_radius"], exclude_cell_ids
+        )
+        if not landmarks:
+            return None
+        return landmarks[int(coverage.argmax())]
+    
+    def _cached_landmarks(self, start_pos: Tuple[int, int], end_pos: Tuple[int, int],
+                          search_radius: int, exclude_cell_ids: set = None) -> Tuple[Tuple, np.ndarray]:
+        """
+        中繼地標搜尋的 LRU 快取
+        
+        Returns:
+            (landmarks, coverage)：LandmarkWithCoverage tuple 與平行的覆蓋率陣列
+        """
+        key = self._landmark_key(start_pos, end_pos, search_radius, exclude_cell_ids)
+        cached = self._landmark_cache.get(key)
+        if cached is None:
+            landmarks = tuple(self._find_landmarks_with_coverage(start_pos, end_pos, search_radius, exclude_cell_ids))
+            coverage = np.array([lm.coverage_ratio for lm in landmarks], dtype=np.float64)
+            cached = (landmarks, coverage)
+            self._landmark_cache[key] = cached
+            if len(self._landmark_cache) > LANDMARK_CACHE_SIZE:
+                self._landmark_cache.popitem(last=False)
+        else:
+            self._landmark_cache.move_to_end(key)
+        return cached
+    
+    def _landmark_key(self, start_pos: Tuple[int, int], end_pos: Tuple[int, int],
+                      search_radius: int, exclude_cell_ids: set = None) -> Tuple:
+        """中繼地標搜尋的快取 key；結果也取決於距離過濾與方位設定，一併放進 key"""
+        return (tuple(start_pos), tuple(end_pos), search_radius,
+                frozenset(exclude_cell_ids) if exclude_cell_ids else frozenset(),
+                self.config.landmark_detection["distance_filter"],
+                self.config.side_calculation["use_hybrid_method"],
+                self.config.side_calculation["long_segment_threshold"])
+    
+    def _find_landmarks_with_coverage(self, start_pos: Tuple[int, int], 
+                                      end_pos: Tuple[int, int], 
+                                      search_radius: int,
+                                      exclude_cell_ids: Optional[set]) -> List[LandmarkWithCoverage]:
+        """find_intermediate_landmarks_with_coverage 的實際搜尋（不經快取）"""
         # 計算移動方向向量
         move_dir = (end_pos[0] - start_pos[0], end_pos[1] - start_pos[1])
         move_length = max(abs(move_dir[0]), abs(move_dir[1]))
@@ -232,83 +571,81 @@ class RouteAnalyzer:
         if move_length == 0:
             return []
         
-        # 記錄每個地標在路徑上的所有出現位置
-        landmark_appearances = {}  # idx -> {side, positions, distances}
+        # 路徑取樣點
+        xs = _segment_samples(start_pos[0], move_dir[0], move_length)
+        ys = _segment_samples(start_pos[1], move_dir[1], move_length)
+        
+        # 搜尋範圍偏移（dx 外層、dy 內層，跳過當前位置）
+        offsets = self._offsets(search_radius)
+        off_dx, off_dy = offsets[:, 0], offsets[:, 1]
+        
+        # 一次查表取得所有 (取樣點, 偏移, layer) 的地標 slot
+        layers, height, width = self.landmark_grid.shape
+        cand_x = xs[:, None] + off_dx[None, :] - self._lm_origin[0]
+        cand_y = ys[:, None] + off_dy[None, :] - self._lm_origin[1]
+        in_bounds = (cand_x >= 0) & (cand_x < width) & (cand_y >= 0) & (cand_y < height)
+        slots = np.full((layers,) + cand_x.shape, -1, dtype=np.int32)
+        slots[:, in_bounds] = self.landmark_grid[:, cand_y[in_bounds], cand_x[in_bounds]]
+        if exclude_cell_ids:
+            excluded = np.isin(self._lm_idx, list(exclude_cell_ids))
+            slots[(slots >= 0) & excluded[slots]] = -1
+        
+        layer, point, offset = np.nonzero(slots >= 0)
+        if len(point) == 0:
+            return []
+        hit_slot = slots[layer, point, offset]
         
-        for i in range(move_length + 1):
-            # 線性插值計算當前位置
-            t = i / move_length
-            current_pos = (
-                int(start_pos[0] + t * move_dir[0]),
-                int(start_pos[1] + t * move_dir[1])
-            )
-            
-            # 搜尋當前位置周圍的地標
-            for dx in range(-search_radius, search_radius + 1):
-                for dy in range(-search_radius, search_radius + 1):
-                    if dx == 0 and dy == 0:  # 跳過當前位置
-                        continue
-                        
-                    search_pos = (current_pos[0] + dx, current_pos[1] + dy)
-                    
-                    if search_pos in self.unit_to_cells:
-                        for cell in self.unit_to_cells[search_pos]:
-                            if (self.is_landmark(cell) and self.is_good_landmark(cell) and 
-                                (exclude_cell_ids is None or cell['idx'] not in exclude_cell_ids)):
-                                
-                                idx = cell['idx']
-                                
-                                # 計算地標的實際unit座標
-                                landmark_unit_pos = (cell['col'], cell['row'])
-                                
-                                # 使用混合方位計算方法
-                                segment_length = move_length
-                                is_long_segment = (self.config.side_calculation["use_hybrid_method"] and 
-                                                 segment_length >= self.config.side_calculation["long_segment_threshold"])
-                                
-                                side = self.calculate_landmark_side_hybrid(
-                                    start_pos, end_pos, landmark_unit_pos,
-                                    is_long_segment=is_long_segment, 
-                                    is_turn_context=False
-                                )
-                                
-                                distance_to_path = max(abs(dx), abs(dy))
-                                
-                                if idx not in landmark_appearances:
-                                    landmark_appearances[idx] = {
-                                        'cell': cell,
-                                        'side': side,
-                                        'positions': [],
-                                        'distances': []
-                                    }
-                                
-                                landmark_appearances[idx]['positions'].append(i)
-                                landmark_appearances[idx]['distances'].append(distance_to_path)
+        # 依原本巢狀迴圈的走訪順序 (取樣點, 偏移, layer) 決定地標的首次出現順序
+        order = np.argsort((point * len(off_dx) + offset) * layers + layer, kind='stable')
+        unique_slots, first = np.unique(hit_slot[order], return_index=True)
+        appearance_order = unique_slots[np.argsort(first)]
         
-        # 計算覆蓋率並創建LandmarkWithCoverage對象
-        landmarks_with_coverage = []
+        # 過濾距離太遠的位置，並按 (地標, 路徑位置) 排序分組
         distance_filter = self.config.landmark_detection["distance_filter"]
+        distance_to_path = np.maximum(np.abs(off_dx), np.abs(off_dy))[offset]
+        valid = distance_to_path <= distance_filter
+        valid_slot, valid_point = hit_slot[valid], point[valid]
+        grouped = np.lexsort((valid_point, valid_slot))
+        valid_slot, valid_point = valid_slot[grouped], valid_point[grouped]
+        bounds = np.searchsorted(valid_slot, appearance_order)
+        ends = np.searchsorted(valid_slot, appearance_order, side='right')
+        
+        # 覆蓋長度 = 各連續段長度總和 = 不重複位置數；以「新位置」旗標的前綴和一次算出每組
+        new_position = np.ones(len(valid_point), dtype=np.int64)
+        new_position[1:] = (valid_slot[1:] != valid_slot[:-1]) | (valid_point[1:] != valid_point[:-1])
+        unique_prefix = np.concatenate(([0], np.cumsum(new_position)))
+        coverage_lengths = unique_prefix[ends] - unique_prefix[bounds]
+        
+        # 使用混合方位計算方法
+        segment_length = move_length
+        is_long_segment = (self.config.side_calculation["use_hybrid_method"] and 
+                         segment_length >= self.config.side_calculation["long_segment_threshold"])
+        # 長距離用segment幾何（±15度），否則點對點（±45度）；兩者向量相同，只差前方門檻，
+        # 因此每段只決定一次門檻，所有地標的方位一次算完
+        front_cos_sq = FRONT_COS_SQ_15 if is_long_segment else FRONT_COS_SQ_45
+        side_codes = _side_codes(move_dir[0], move_dir[1],
+                                 self._lm_pos[appearance_order, 0] - start_pos[0],
+                                 self._lm_pos[appearance_order, 1] - start_pos[1], front_cos_sq)
         
-        for idx, data in landmark_appearances.items():
-            # 過濾距離太遠的位置
-            valid_positions = []
-            for pos, dist in zip(data['positions'], data['distances']):
-                if dist <= distance_filter:
-                    valid_positions.append(pos)
-            
-            if not valid_positions:
+        # 計算覆蓋率並創建LandmarkWithCoverage對象
+        landmarks_with_coverage = []
+        for slot, lo, hi, coverage_length, side_code in zip(appearance_order.tolist(), bounds.tolist(),
+                                                            ends.tolist(), coverage_lengths.tolist(),
+                                                            side_codes.tolist()):
+            if lo == hi:
                 continue
+            valid_positions = valid_point[lo:hi].tolist()
+            cell = self._lm_cells[slot]
             
             # 計算覆蓋率：連續段的總長度 / 路徑總長度
-            valid_positions.sort()
-            coverage_length = self._calculate_coverage_length(valid_positions)
             coverage_ratio = coverage_length / move_length
             
             landmark_with_coverage = LandmarkWithCoverage(
-                cell=data['cell'],
-                side=data['side'],
+                cell=cell,
+                side=SIDE_NAMES[side_code],
                 coverage_ratio=coverage_ratio,
-                path_positions=valid_positions
+                path_positions=valid_positions,
+                side_code=side_code
             )
             landmarks_with_coverage.append(landmark_with_coverage)
         
@@ -316,28 +653,8 @@ class RouteAnalyzer:
     
     def _calculate_coverage_length(self, positions: List[int]) -> int:
         """計算位置列表的覆蓋長度（考慮連續段）"""
-        if not positions:
-            return 0
-        
-        positions = sorted(set(positions))  # 去重並排序
-        
-        # 計算連續段的總長度
-        total_length = 0
-        start = positions[0]
-        end = positions[0]
-        
-        for i in range(1, len(positions)):
-            if positions[i] == end + 1:  # 連續
-                end = positions[i]
-            else:  # 不連續，開始新段
-                total_length += (end - start + 1)
-                start = positions[i]
-                end = positions[i]
-        
-        # 加上最後一段
-        total_length += (end - start + 1)
-        
-        return total_length
+        # 各連續段長度 (end - start + 1) 的總和恰為不重複位置的個數
+        return len(set(positions))
 
     def find_intermediate_landmarks(self, start_pos: Tuple[int, int], 
                                   end_pos: Tuple[int, int], 
@@ -361,7 +678,8 @@ class RouteAnalyzer:
         )
         
         # 轉換為舊格式（按覆蓋率排序）
-        landmarks_with_coverage.sort(key=lambda x: (-x.coverage_ratio, self.get_landmark_priority(x.cell)))
+        priority = self.landmark_priority
+        landmarks_with_coverage.sort(key=lambda x: (-x.coverage_ratio, priority[x.cell['idx']]))
         
         return [(lm.cell, lm.side) for lm in landmarks_with_coverage]
     
@@ -379,6 +697,26 @@ class RouteAnalyzer:
         Returns:
             {"crossing": [...], "left": [...], "right": [...]}
         """
+        key = (self._landmark_key(start_pos, end_pos, self.config.landmark_detection["search_radius"],
+                                  exclude_cell_ids),
+               self.config.sequence_selection["max_landmarks_per_side"])
+        cached = self._three_seq_cache.get(key)
+        if cached is None:
+            sequences = self._generate_three_sequences(start_pos, end_pos, exclude_cell_ids)
+            cached = {name: tuple(sequence) for name, sequence in sequences.items()}
+            self._three_seq_cache[key] = cached
+            if len(self._three_seq_cache) > THREE_SEQ_CACHE_SIZE:
+                self._three_seq_cache.popitem(last=False)
+        else:
+            self._three_seq_cache.move_to_end(key)
+        
+        # 呼叫端可能修改序列，因此每次給新的 list
+        return {name: list(sequence) for name, sequence in cached.items()}
+    
+    def _generate_three_sequences(self, start_pos: Tuple[int, int], 
+                                  end_pos: Tuple[int, int], 
+                                  exclude_cell_ids: set = None) -> Dict[str, List[LandmarkWithCoverage]]:
+        """generate_three_sequences 的實際計算（未經快取）"""
         # 獲取所有帶覆蓋率的地標
         all_landmarks = self.find_intermediate_landmarks_with_coverage(
             start_pos, end_pos, exclude_cell_ids=exclude_cell_ids
@@ -388,10 +726,11 @@ class RouteAnalyzer:
         crossing_landmarks = []
         # TODO: 實現穿越地標檢測邏輯
         
-        # 按側邊分組
-        left_landmarks = [lm for lm in all_landmarks if lm.side == "left"]
-        right_landmarks = [lm for lm in all_landmarks if lm.side == "right"]
-        front_landmarks = [lm for lm in all_landmarks if lm.side == "front"]
+        # 按側邊分組（以 side_code 一次分區）
+        codes = np.fromiter((lm.side_code for lm in all_landmarks), dtype=np.int8, count=len(all_landmarks))
+        left_landmarks = [all_landmarks[i] for i in np.flatnonzero(codes == SIDE_LEFT)]
+        right_landmarks = [all_landmarks[i] for i in np.flatnonzero(codes == SIDE_RIGHT)]
+        front_landmarks = [all_landmarks[i] for i in np.flatnonzero(codes == SIDE_FRONT)]
         
         # front地標保持獨立，不合併到left/right
         
@@ -425,14 +764,11 @@ class RouteAnalyzer:
         if not landmarks:
             return []
         
-        # 1. 按覆蓋率排序（從高到低）
-        landmarks.sort(key=lambda x: -x.coverage_ratio)
-        
-        # 2. Top-K選擇
-        top_landmarks = landmarks[:max_count]
+        # 1-2. 按覆蓋率取 Top-K（同覆蓋率維持原順序，與穩定排序後取前 K 個相同）
+        top_landmarks = heapq.nlargest(max_count, landmarks, key=COVERAGE_OF)
         
-        # 3. 按路徑順序重排（使用第一個出現位置）
-        top_landmarks.sort(key=lambda x: min(x.path_positions))
+        # 3. 按路徑順序重排（path_positions 已遞增排序，第一個即最早出現位置）
+        top_landmarks.sort(key=lambda x: x.path_positions[0])
         
         return top_landmarks
 
@@ -479,7 +815,7 @@ class RouteAnalyzer:
         
         # 如果數量相同，選擇優先級最高的一側
         if len(best_side) == len(candidates[0]):
-            best_side = min(candidates, key=lambda side: self.get_landmark_priority(side[0][0]) if side else 999)
+            best_side = min(candidates, key=lambda side: self.landmark_priority[side[0][0]['idx']] if side else 999)
         
         return best_side
     
@@ -504,29 +840,29 @@ class RouteAnalyzer:
         if move_length == 0:
             return crossing_landmarks
         
-        # 遍歷路徑上的點
-        seen_idx = set()
-        for i in range(move_length + 1):
-            if move_length == 0:
-                current_pos = start_pos
-            else:
-                # 線性插值計算當前位置
-                t = i / move_length
-                current_pos = (
-                    int(start_pos[0] + t * move_dir[0]),
-                    int(start_pos[1] + t * move_dir[1])
-                )
-            
-            # 檢查當前位置是否在大型地標內
-            if current_pos in self.unit_to_cells:
-                for cell in self.unit_to_cells[current_pos]:
-                    if (cell.get('type') in ['exp hall', 'stage', 'Lounge'] and 
-                        cell['idx'] not in seen_idx):
-                        crossing_landmarks.append(cell)
-                        seen_idx.add(cell['idx'])
+        # 取樣路徑上的點，經 CSR 一次收集各點覆蓋的所有 cells（保留重疊的 cells）
+        xs = _segment_samples(start_pos[0], move_dir[0], move_length) - self._unit_origin[0]
+        ys = _segment_samples(start_pos[1], move_dir[1], move_length) - self._unit_origin[1]
+        height, width = self._unit_shape
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        flats = ys[inside] * width + xs[inside]
+        starts = self.cell_offsets[flats]
+        counts = self.cell_offsets[flats + 1] - starts
+        if counts.sum() == 0:
+            return crossing_landmarks
+        slots = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        positions = self.cell_indices[slots]
+        
+        # 只保留大型地標，並依首次出現的順序去重
+        ids = self._cell_idx[positions]
+        hit = self.large_landmark_mask[ids]
+        hit_ids, hit_positions = ids[hit], positions[hit]
+        _, first_idx = np.unique(hit_ids, return_index=True)
+        first_idx.sort()
         
-        # 按優先級排序
-        crossing_landmarks.sort(key=self.get_landmark_priority)
+        # 按優先級排序（穩定排序，同優先級維持路徑上的出現順序）
+        order = first_idx[np.argsort(self.landmark_priority[hit_ids[first_idx]], kind='stable')]
+        crossing_landmarks = [self.grid_data[k] for k in hit_positions[order]]
         
         return crossing_landmarks
     
@@ -541,30 +877,13 @@ class RouteAnalyzer:
         Returns:
             "left", "right", "straight"
         """
-        # 向量 p1->p2 和 p2->p3
-        v1 = (p2[0] - p1[0], p2[1] - p1[1])
-        v2 = (p3[0] - p2[0], p3[1] - p2[1])
-        
-        # 外積（叉積的 z 分量）
-        cross_product = v1[0] * v2[1] - v1[1] * v2[0]
-        
-        # 修正座標系：row軸向下，需反轉判斷
-        if cross_product > 0:
-            return "right"  # 修正：原左轉改為右轉
-        elif cross_product < 0:
-            return "left"   # 修正：原右轉改為左轉
-        else:
-            return "straight"
+        # 向量 p1->p2 和 p2->p3 的外積（叉積的 z 分量）
+        # 修正座標系：row軸向下，外積 > 0 為右轉、< 0 為左轉
+        return TURN_NAMES[_turn_dir_nb(p1[0], p1[1], p2[0], p2[1], p3[0], p3[1])]
     
     def get_direction_name(self, from_pos: Tuple[int, int], to_pos: Tuple[int, int]) -> str:
         """獲取方向名稱（north/east/south/west）"""
-        dx = to_pos[0] - from_pos[0]
-        dy = to_pos[1] - from_pos[1]
-        
-        if abs(dx) > abs(dy):
-            return "east" if dx > 0 else "west"
-        else:
-            return "south" if dy > 0 else "north"
+        return DIRECTION_NAMES[_direction_nb(to_pos[0] - from_pos[0], to_pos[1] - from_pos[1])]
     
     def find_nearby_landmarks(self, current_pos: Tuple[int, int], 
                             next_pos: Tuple[int, int], 
@@ -581,75 +900,41 @@ class RouteAnalyzer:
             List of (cell, side) tuples，按優先級排序
         """
         landmarks = []
+        seen_idx = set()
         
         # 計算移動方向向量
         move_dir = (next_pos[0] - current_pos[0], next_pos[1] - current_pos[1])
         
-        # 搜尋周圍格子
-        for dx in range(-search_radius, search_radius + 1):
-            for dy in range(-search_radius, search_radius + 1):
-                if dx == 0 and dy == 0:  # 跳過當前位置
+        # 搜尋周圍格子；同一個 landmark 可能佔多個 unit，只取第一次出現的位置
+        for dx, dy in self._offsets(search_radius).tolist():
+            search_pos = (current_pos[0] + dx, current_pos[1] + dy)
+            
+            for cell in self._cells_at(search_pos):
+                idx = cell['idx']
+                if idx in seen_idx:
                     continue
-                    
-                search_pos = (current_pos[0] + dx, current_pos[1] + dy)
-                
-                if search_pos in self.unit_to_cells:
-                    for cell in self.unit_to_cells[search_pos]:
-                        if self.is_landmark(cell) and self.is_good_landmark(cell):
-                            # 計算地標相對於移動方向的位置
-                            landmark_dir = (dx, dy)
-                            side = self.calculate_relative_side(move_dir, landmark_dir)
-                            landmarks.append((cell, side))
-        
-        # 去重（同一個landmark可能佔多個unit）
-        unique_landmarks = []
-        seen_idx = set()
-        for cell, side in landmarks:
-            if cell['idx'] not in seen_idx:
-                unique_landmarks.append((cell, side))
-                seen_idx.add(cell['idx'])
+                seen_idx.add(idx)
+                if not self.good_landmark_mask[idx]:
+                    continue
+                # 計算地標相對於移動方向的位置
+                side = self.calculate_relative_side(move_dir, (dx, dy))
+                landmarks.append((cell, side))
         
         # 按優先級排序：front > left/right > behind
-        priority_order = {"front": 0, "left": 1, "right": 1, "behind": 2}
-        unique_landmarks.sort(key=lambda x: priority_order.get(x[1], 3))
-        
-        return unique_landmarks
+        return sorted(landmarks, key=lambda x: SIDE_PRIORITY[x[1]])
     
     def calculate_relative_side_segment_based(self, segment_start: Tuple[int, int], 
                                             segment_end: Tuple[int, int], 
                                             landmark_pos: Tuple[int, int]) -> str:
         """基於segment幾何關係計算地標方位"""
         
-        # 計算segment方向向量
-        segment_dir = (segment_end[0] - segment_start[0], segment_end[1] - segment_start[1])
-        segment_length = math.sqrt(segment_dir[0]**2 + segment_dir[1]**2)
-        
-        if segment_length == 0:
-            return "unknown"
-        
-        # 計算landmark相對於segment起點的向量
-        landmark_dir = (landmark_pos[0] - segment_start[0], landmark_pos[1] - segment_start[1])
-        landmark_length = math.sqrt(landmark_dir[0]**2 + landmark_dir[1]**2)
-        
-        if landmark_length == 0:
-            return "unknown"
-        
-        # 內積判斷前後
-        dot = (segment_dir[0] * landmark_dir[0] + segment_dir[1] * landmark_dir[1]) / (segment_length * landmark_length)
-        
+        # segment方向向量 vs landmark相對於segment起點的向量
         # 前方區域：內積 >= cos(15°) ≈ 0.966 (±15度內) - 更嚴格的前方判斷
-        if dot >= 0.966:
-            return "front"
-        
-        # 外積判斷左右（修正座標系）
-        cross = segment_dir[0] * landmark_dir[1] - segment_dir[1] * landmark_dir[0]
-        
-        if cross > 0:
-            return "right"  # 修正：原左改為右
-        elif cross < 0:
-            return "left"   # 修正：原右改為左
-        else:
-            return "behind"
+        return SIDE_NAMES[_side_nb(
+            segment_end[0] - segment_start[0], segment_end[1] - segment_start[1],
+            landmark_pos[0] - segment_start[0], landmark_pos[1] - segment_start[1],
+            FRONT_COS_SQ_15
+        )]
     
     def calculate_landmark_side_hybrid(self, segment_start: Tuple[int, int], 
                                      segment_end: Tuple[int, int], 
@@ -670,29 +955,33 @@ class RouteAnalyzer:
     def calculate_relative_side(self, move_dir: Tuple[int, int], 
                               landmark_dir: Tuple[int, int]) -> str:
         """計算地標相對於移動方向的側邊，實現三分區邏輯"""
-        # 歸一化向量
-        move_length = math.sqrt(move_dir[0]**2 + move_dir[1]**2)
-        landmark_length = math.sqrt(landmark_dir[0]**2 + landmark_dir[1]**2)
-        
-        if move_length == 0 or landmark_length == 0:
-            return "unknown"
-        
-        # 內積判斷前後
-        dot = (move_dir[0] * landmark_dir[0] + move_dir[1] * landmark_dir[1]) / (move_length * landmark_length)
-        
         # 前方區域：內積 >= cos(45°) ≈ 0.707 (±45度內)
-        if dot >= 0.707:
-            return "front"
-        
-        # 外積判斷左右（修正座標系）
-        cross = move_dir[0] * landmark_dir[1] - move_dir[1] * landmark_dir[0]
+        return SIDE_NAMES[_side_nb(move_dir[0], move_dir[1], landmark_dir[0], landmark_dir[1], FRONT_COS_SQ_45)]
+    
+    def _segment_table(self, unit_path: List[Tuple[int, int]], turn_indices: List[int]) -> np.ndarray:
+        """
+        依轉彎點把路徑切成直線段，一次算好各段的端點、方向向量與長度
         
-        if cross > 0:
-            return "right"  # 修正：原左改為右
-        elif cross < 0:
-            return "left"   # 修正：原右改為左
-        else:
-            return "behind"
+        Returns:
+            SEGMENT_DTYPE 陣列；第 k 列為第 k 個轉彎點之前的直線段，最後一列為終段
+        """
+        path_xy = np.asarray(unit_path, dtype=np.int64).reshape(-1, 2)
+        breaks = np.array([0] + list(turn_indices) + [len(unit_path) - 1], dtype=np.int64)
+        i0, i1 = breaks[:-1], breaks[1:]
+        
+        segments = np.empty(len(i0), dtype=SEGMENT_DTYPE)
+        segments['i0'], segments['i1'] = i0, i1
+        segments['sx'], segments['sy'] = path_xy[i0, 0], path_xy[i0, 1]
+        segments['ex'], segments['ey'] = path_xy[i1, 0], path_xy[i1, 1]
+        dx = path_xy[i1, 0] - path_xy[i0, 0]
+        dy = path_xy[i1, 1] - path_xy[i0, 1]
+        segments['dx'], segments['dy'] = dx, dy
+        segments['length'] = np.maximum(np.abs(dx), np.abs(dy))
+        # 與 _direction_nb 相同的判斷，對應 DIRECTION_NAMES
+        segments['dir_code'] = np.where(np.abs(dx) > np.abs(dy),
+                                        np.where(dx > 0, 0, 1),
+                                        np.where(dy > 0, 2, 3))
+        return segments
     
     def analyze_route(self, route_result: RouteResult) -> List[NavigationStep]:
         """
@@ -716,17 +1005,16 @@ class RouteAnalyzer:
             ))
             return steps
         
-        # 先找出所有轉彎點
-        turn_points = []
-        for i in range(1, len(unit_path) - 1):
-            turn_dir = self.detect_turn_direction(
-                unit_path[i-1], unit_path[i], unit_path[i+1]
-            )
-            if turn_dir != "straight":
-                turn_points.append((i, turn_dir))
+        # 先找出所有轉彎點：整條路徑一次算相鄰兩步的外積（同 detect_turn_direction）
+        path_xy = np.asarray(unit_path, dtype=np.int64).reshape(-1, 2)
+        step_dx, step_dy = np.diff(path_xy, axis=0).T
+        cross = step_dx[:-1] * step_dy[1:] - step_dy[:-1] * step_dx[1:]
+        turn_points = [(i + 1, "right" if cross[i] > 0 else "left") for i in np.flatnonzero(cross).tolist()]
+        
+        # 轉彎點切出的直線段，每段一列（最後一列為終段）
+        segments = self._segment_table(unit_path, [pos for pos, _ in turn_points])
         
         step_id = 1
-        current_pos = 0
         
         # 生成起步指令（如果有長距離直線段）
         if turn_points:
@@ -757,14 +1045,12 @@ class RouteAnalyzer:
                     step_id += 1
         
         # 處理每個轉彎點
-        for turn_pos, turn_dir in turn_points:
+        for segment, (turn_pos, turn_dir) in zip(segments, turn_points):
             # 生成到轉彎點的直線段
-            distance = turn_pos - current_pos
+            distance = int(segment['i1'] - segment['i0'])
             
             if distance > 0:
-                direction = self.get_direction_name(
-                    unit_path[current_pos], unit_path[turn_pos]
-                )
+                direction = DIRECTION_NAMES[segment['dir_code']]
                 
                 steps.append(NavigationStep(
                     step_id=step_id,
@@ -806,15 +1092,13 @@ class RouteAnalyzer:
                 landmark=landmark_info
             ))
             step_id += 1
-            current_pos = turn_pos
         
         # 處理最後一段
-        final_distance = len(unit_path) - 1 - current_pos
+        final_segment = segments[-1]
+        final_distance = int(final_segment['i1'] - final_segment['i0'])
         
         if final_distance > 0:
-            direction = self.get_direction_name(
-                unit_path[current_pos], unit_path[-1]
-            )
+            direction = DIRECTION_NAMES[final_segment['dir_code']]
             
             steps.append(NavigationStep(
                 step_id=step_id,
@@ -839,15 +1123,15 @@ class RouteAnalyzer:
                 target_pos = unit_path[-1]
                 target_landmarks = self.find_nearby_landmarks(unit_path[-2], target_pos, search_radius=1)
                 
-                # 查找目的地本身的方位
-                for landmark, side in target_landmarks:
-                    if landmark['idx'] == target_idx:
-                        arrival_landmark = LandmarkInfo(
-                            idx=target_cell['idx'],
-                            name=target_cell.get('name', f"格子 {target_cell['idx']}"),
-                            side=side
-                        )
-                        break
+                # 查找目的地本身的方位（find_nearby_landmarks 已依 idx 去重）
+                side_by_idx = {landmark['idx']: side for landmark, side in target_landmarks}
+                side = side_by_idx.get(target_idx)
+                if side is not None:
+                    arrival_landmark = LandmarkInfo(
+                        idx=target_cell['idx'],
+                        name=target_cell.get('name', f"格子 {target_cell['idx']}"),
+                        side=side
+                    )
                 
                 # 如果沒找到，直接計算目的地相對方位
                 if not arrival_landmark and len(unit_path) >= 2:
@@ -869,6 +1153,34 @@ class RouteAnalyzer:
         
         return steps
     
+    def select_sequence_for_segment(self, start_pos: Tuple[int, int], 
+                                    end_pos: Tuple[int, int], 
+                                    exclude_cell_ids: set = None) -> Tuple[str, List[LandmarkWithCoverage], bool]:
+        """
+        生成三序列並選出最佳序列（依路段與排除集合快取）
+        
+        Returns:
+            (sequence_name, sequence, is_fallback)
+        """
+        key = (self._landmark_key(start_pos, end_pos, self.config.landmark_detection["search_radius"],
+                                  exclude_cell_ids),
+               self.config.sequence_selection["max_landmarks_per_side"],
+               self.config.sequence_selection["min_coverage_threshold"],
+               self.config.sequence_selection["use_front_fallback"])
+        cached = self._sequence_cache.get(key)
+        if cached is None:
+            sequences = self.generate_three_sequences(start_pos, end_pos, exclude_cell_ids)
+            name, sequence, is_fallback = self.select_best_sequence_with_fallback(sequences)
+            cached = (name, tuple(sequence), is_fallback)
+            self._sequence_cache[key] = cached
+            if len(self._sequence_cache) > LANDMARK_CACHE_SIZE:
+                self._sequence_cache.popitem(last=False)
+        else:
+            self._sequence_cache.move_to_end(key)
+        
+        name, sequence, is_fallback = cached
+        return name, list(sequence), is_fallback
+    
     def select_best_sequence_with_fallback(self, sequences: Dict[str, List[LandmarkWithCoverage]]) -> Tuple[str, List[LandmarkWithCoverage], bool]:
         """
         新的序列選擇策略：優先比較穿越/左右方，低覆蓋率時回退到前方landmark
@@ -882,24 +1194,21 @@ class RouteAnalyzer:
         min_threshold = self.config.sequence_selection["min_coverage_threshold"]
         use_fallback = self.config.sequence_selection["use_front_fallback"]
         
-        # 第一階段：只比較穿越/左右方序列
-        primary_sequences = {k: v for k, v in sequences.items() if k in ["crossing", "left", "right"]}
+        # 第一階段：只比較穿越/左右方序列（依 sequences 的順序，同分取先出現者）
+        primary_names = [name for name in sequences if name in PRIMARY_SEQUENCE_NAMES]
         
+        # 各序列的平均覆蓋率；空序列記為 -1，一次 argmax 選出最佳序列
+        avg_coverages = [sum(map(COVERAGE_OF, sequences[name])) / len(sequences[name])
+                         if sequences[name] else -1.0 for name in primary_names]
         best_score = -1
         best_name = None
         best_sequence = []
-        
-        for name, sequence in primary_sequences.items():
-            if not sequence:
-                continue
-            
-            # 計算平均覆蓋率
-            avg_coverage = sum(lm.coverage_ratio for lm in sequence) / len(sequence)
-            
-            if avg_coverage > best_score:
-                best_score = avg_coverage
-                best_name = name
-                best_sequence = sequence
+        if avg_coverages:
+            best_i = int(np.argmax(avg_coverages))
+            if avg_coverages[best_i] >= 0:
+                best_score = avg_coverages[best_i]
+                best_name = primary_names[best_i]
+                best_sequence = sequences[best_name]
         
         # 檢查是否需要回退到前方landmark
         if use_fallback and best_score < min_threshold and "front" in sequences and sequences["front"]:
@@ -929,10 +1238,10 @@ class RouteAnalyzer:
             (sequence_name, combined_sequence, is_fallback)
         """
         # 選擇覆蓋率最高的低覆蓋landmark（作為"經過"對象）
-        primary_landmark = max(low_coverage_sequence, key=lambda x: x.coverage_ratio)
+        primary_landmark = max(low_coverage_sequence, key=COVERAGE_OF)
         
         # 選擇優先級最高的前方landmark（作為目標）
-        target_landmark = max(front_sequence, key=lambda x: self.get_landmark_priority(x.cell))
+        target_landmark = max(front_sequence, key=lambda x: self.landmark_priority[x.cell['idx']])
         
         # 標記組合序列類型
         combined_name = f"{primary_side}_to_front"
@@ -948,10 +1257,15 @@ class RuleFormatter:
     
     def __init__(self):
         """初始化格式化器"""
-        pass
+        # format_distance 的距離級距：索引為 ceil(units)，0-3 短距離、4-15 中距離、16 以上長距離
+        self._distance_bands = ([self._format_short_distance] * 4 +
+                                [self._format_mid_distance] * 12 +
+                                [self._format_long_distance])
     
     def units_to_booth_count(self, units: int) -> int:
         """將 units 轉換為攤位數量（粗略估算：1 攤位 ≈ 2-3 units）"""
+        if isinstance(units, int) and 0 <= units < len(BOOTH_COUNT_LUT):
+            return BOOTH_COUNT_LUT[units]
         return max(1, round(units / 2.5))
     
     def count_sequence_booths(self, landmarks: List) -> int:
@@ -969,31 +1283,36 @@ class RuleFormatter:
         
         # 直接使用距離估算
         booth_count = self.units_to_booth_count(units)
+        has_route_context = bool(start_pos and end_pos and analyzer)
         
-        # 新的距離分級策略
-        if units <= 3:
-            # 短距離：僅攤位計數
-            if booth_count == 0:
-                return "走過一小段距離"
-            return f"走過 {booth_count} 個攤位"
-            
-        elif units <= 15:
-            # 中距離：使用中繼地標 + 攤位計數
-            if start_pos and end_pos and analyzer:
-                return self.format_with_intermediate_landmarks(
-                    units, start_pos, end_pos, analyzer, exclude_cell_ids
-                )
-            else:
-                return f"直走約 {booth_count} 個攤位"
-                
-        else:  # units > 15
-            # 長距離：使用多地標（最多3個，同側優先）
-            if start_pos and end_pos and analyzer:
-                return self.format_with_multiple_landmarks(
-                    units, start_pos, end_pos, analyzer, exclude_cell_ids
-                )
-            else:
-                return "直走較長距離，約 2 分鐘"
+        # 新的距離分級策略：依 units 查表取得對應級距的格式化方法
+        band = self._distance_bands[min(max(math.ceil(units), 0), len(self._distance_bands) - 1)]
+        return band(units, booth_count, has_route_context, start_pos, end_pos, analyzer, exclude_cell_ids)
+    
+    def _format_short_distance(self, units, booth_count, has_route_context, start_pos, end_pos,
+                               analyzer, exclude_cell_ids) -> str:
+        """短距離（units <= 3）：僅攤位計數"""
+        if booth_count == 0:
+            return "走過一小段距離"
+        return f"走過 {booth_count} 個攤位"
+    
+    def _format_mid_distance(self, units, booth_count, has_route_context, start_pos, end_pos,
+                             analyzer, exclude_cell_ids) -> str:
+        """中距離（units <= 15）：使用中繼地標 + 攤位計數"""
+        if has_route_context:
+            return self.format_with_intermediate_landmarks(
+                units, start_pos, end_pos, analyzer, exclude_cell_ids
+            )
+        return f"直走約 {booth_count} 個攤位"
+    
+    def _format_long_distance(self, units, booth_count, has_route_context, start_pos, end_pos,
+                              analyzer, exclude_cell_ids) -> str:
+        """長距離（units > 15）：使用多地標（最多3個，同側優先）"""
+        if has_route_context:
+            return self.format_with_multiple_landmarks(
+                units, start_pos, end_pos, analyzer, exclude_cell_ids
+            )
+        return "直走較長距離，約 2 分鐘"
     
     def format_with_intermediate_landmarks(self, units: int, start_pos: Tuple[int, int], 
                                          end_pos: Tuple[int, int], analyzer: 'RouteAnalyzer',
@@ -1008,13 +1327,9 @@ class RuleFormatter:
                 return f"直走穿越{landmark.get('name', '大型區域')}"
             return f"直走穿越{landmark.get('name', '大型區域')}，約 {booth_count} 個攤位"
         
-        # 使用新的覆蓋率系統搜尋中繼地標
-        landmarks_with_coverage = analyzer.find_intermediate_landmarks_with_coverage(
-            start_pos, end_pos, exclude_cell_ids=exclude_cell_ids
-        )
-        if landmarks_with_coverage:
-            # 選擇覆蓋率最高的地標
-            best_landmark = max(landmarks_with_coverage, key=lambda x: x.coverage_ratio)
+        # 使用新的覆蓋率系統搜尋中繼地標，選擇覆蓋率最高的地標
+        best_landmark = analyzer.best_intermediate_landmark(start_pos, end_pos, exclude_cell_ids)
+        if best_landmark is not None:
             side_text = self.get_side_text(best_landmark.side)
             booth_count = 1  # 單個地標計為1個攤位
             if booth_count <= 1:
@@ -1030,46 +1345,39 @@ class RuleFormatter:
                                      exclude_cell_ids: set = None) -> str:
         """使用多個地標格式化長距離（基於覆蓋率的三序列選擇）"""
         
-        # 生成三個候選序列
-        sequences = analyzer.generate_three_sequences(start_pos, end_pos, exclude_cell_ids)
-        
-        # 使用新的序列選擇策略：優先比較穿越/左右方，低覆蓋率時回退到前方landmark
-        best_sequence_name, best_sequence, is_fallback = analyzer.select_best_sequence_with_fallback(sequences)
+        # 生成三個候選序列，並以新的序列選擇策略挑選：優先比較穿越/左右方，低覆蓋率時回退到前方landmark
+        best_sequence_name, best_sequence, is_fallback = analyzer.select_sequence_for_segment(
+            start_pos, end_pos, exclude_cell_ids
+        )
         
         if not best_sequence:
             return "直走到底，約 2 分鐘"
         
-        # 計算序列攤位數
+        # 計算序列攤位數，並一次取出序列中的地標名稱（穿越序列的預設名稱為「區域」）
         booth_count = self.count_sequence_booths(best_sequence)
+        default_name = '區域' if best_sequence_name == "crossing" else '地標'
+        names = [lm.cell.get('name', default_name) for lm in best_sequence]
+        booth_text = f"，約 {booth_count} 個攤位"
         
         # 格式化描述
         if is_fallback and "_to_front" in best_sequence_name:
             # 組合序列：經過[低覆蓋率landmark] → 走至[前方landmark]
-            if len(best_sequence) >= 2:
-                pass_by = best_sequence[0].cell.get('name', '地標')
-                target = best_sequence[1].cell.get('name', '地標')
+            if len(names) >= 2:
                 primary_side = best_sequence_name.split('_to_front')[0]
                 side_text = self.get_side_text(primary_side)
-                return f"直走經過{side_text}的{pass_by}，走至{target}前，約 {booth_count} 個攤位"
+                return f"直走經過{side_text}的{names[0]}，走至{names[1]}前{booth_text}"
             else:
                 # 回退情況：只有前方landmark
-                target = best_sequence[0].cell.get('name', '地標')
-                return f"直走走至{target}前，約 {booth_count} 個攤位"
+                return f"直走走至{names[0]}前{booth_text}"
         elif best_sequence_name == "crossing":
-            names = [lm.cell.get('name', '區域') for lm in best_sequence]
-            if len(names) == 1:
-                return f"直走穿越{names[0]}，約 {booth_count} 個攤位"
-            else:
-                return f"直走穿越{self.join_landmarks(names)}，約 {booth_count} 個攤位"
+            return f"直走穿越{self.join_landmarks(names)}{booth_text}"
         elif best_sequence_name == "front":
             # 純前方landmark指引
-            names = [lm.cell.get('name', '地標') for lm in best_sequence]
-            return f"直走走至{self.join_landmarks(names)}前，約 {booth_count} 個攤位"
+            return f"直走走至{self.join_landmarks(names)}前{booth_text}"
         else:
             # 傳統的左右方landmark
             side_text = self.get_side_text(best_sequence_name)
-            names = [lm.cell.get('name', '地標') for lm in best_sequence]
-            return f"直走經過{side_text}的{self.join_landmarks(names)}，約 {booth_count} 個攤位"
+            return f"直走經過{side_text}的{self.join_landmarks(names)}{booth_text}"
     
     def select_best_sequence_by_coverage(self, sequences: Dict[str, List[LandmarkWithCoverage]]) -> Tuple[str, List[LandmarkWithCoverage]]:
         """
@@ -1090,7 +1398,7 @@ class RuleFormatter:
                 continue
             
             # 計算平均覆蓋率
-            avg_coverage = sum(lm.coverage_ratio for lm in sequence) / len(sequence)
+            avg_coverage = sum(map(COVERAGE_OF, sequence)) / len(sequence)
             
             if avg_coverage > best_score:
                 best_score = avg_coverage
@@ -1153,44 +1461,20 @@ class RuleFormatter:
     
     def get_side_text(self, side: str) -> str:
         """獲取方位文字"""
-        side_map = {
-            "left": "左手邊",
-            "right": "右手邊", 
-            "front": "前方",
-            "behind": "後方"
-        }
-        return side_map.get(side, "附近")
+        return SIDE_TEXT.get(side, "附近")
     
     def join_landmarks(self, names: List[str]) -> str:
-        """連接多個地標名稱"""
-        if len(names) == 1:
-            return names[0]
-        elif len(names) == 2:
-            return f"{names[0]}、{names[1]}"
-        else:
-            return f"{names[0]}、{names[1]}、{names[2]}"
+        """連接多個地標名稱（最多 3 個）"""
+        return "、".join(names[:3])
     
     def format_landmark(self, landmark: LandmarkInfo) -> str:
         """格式化地標描述"""
-        side_map = {
-            "left": "左手邊",
-            "right": "右手邊", 
-            "front": "前方",
-            "behind": "後方"
-        }
-        side_text = side_map.get(landmark.side, "附近")
+        side_text = SIDE_TEXT.get(landmark.side, "附近")
         return f"{side_text}的 {landmark.name}"
     
     def format_action(self, action: str) -> str:
         """格式化動作描述"""
-        action_map = {
-            "orient": "面向",
-            "turn_left": "左轉",
-            "turn_right": "右轉",
-            "continue": "繼續直走",
-            "arrive": "到達目的地"
-        }
-        return action_map.get(action, action)
+        return ACTION_TEXT.get(action, action)
     
     def generate_navigation_text(self, steps: List[NavigationStep], 
                                   unit_path: List[Tuple[int, int]] = None,
@@ -1268,12 +1552,9 @@ class NavigationGenerator:
                  grid_types_file: str = "data/grid_types.json",
                  config: NavigationConfig = None):
         """初始化導航生成器"""
-        # 載入資料
-        with open(grid_file, 'r', encoding='utf-8') as f:
-            self.grid_data = json.load(f)
-        
-        with open(grid_types_file, 'r', encoding='utf-8') as f:
-            self.grid_types = json.load(f)
+        # 載入資料（同一檔案重複建立生成器時沿用已解析的結果）
+        self.grid_data = _load_json(grid_file)
+        self.grid_types = _load_json(grid_types_file)
         
         # 初始化組件
         self.analyzer = RouteAnalyzer(self.grid_data, self.grid_types, config)
@@ -1338,8 +1619,8 @@ class NavigationGenerator:
         Returns:
             包含步驟和指令的字典
         """
-        with open(route_file, 'r', encoding='utf-8') as f:
-            route_data = json.load(f)
+        # 批次生成同一起點的多條路線時，路徑檔只解析一次
+        route_data = _load_json(route_file)
         
         # 找到對應的路徑
         target_key = str(end_idx)
@@ -1360,6 +1641,13 @@ class NavigationGenerator:
         return self.generate_from_route_result(route_result)
 
 
+def dumps_steps(steps: List[Dict]) -> str:
+    """將步驟列表序列化為縮排 2 格的 JSON 字串（有 orjson 時使用 orjson）"""
+    if orjson is not None:
+        return orjson.dumps(steps, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(steps, ensure_ascii=False, indent=2)
+
+
 def main():
     """命令行介面測試"""
     if len(sys.argv) < 3:
@@ -1385,7 +1673,7 @@ def main():
             print(f"{i}. {instruction}")
         
         print("\n詳細步驟 (JSON):")
-        print(json.dumps(result['steps'], ensure_ascii=False, indent=2))
+        print(dumps_steps(result['steps']))
         
     except Exception as e:
         print(f"錯誤: {e}")
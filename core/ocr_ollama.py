@@ -3,8 +3,12 @@ OCR 模組 - 使用 Ollama 視覺模型進行 booth 資訊識別
 支援 JSON Schema 輸出，確保結構化資料品質
 """
 
+import asyncio
+import hashlib
 import json
 import os
+import shelve
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from dataclasses import asdict
@@ -15,12 +19,56 @@ import numpy as np
 from PIL import Image
 import ollama
 
-from .grid import Cell, load_grid, save_grid
+try:
+    import orjson  # 選用：C 實作的 JSON，解析回應與讀寫結果檔較快
+except ImportError:
+    orjson = None
+
+from .grid import Cell, build_idx_map, load_grid, save_grid
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# OCR 系統提示詞
+SYSTEM_PROMPT = """你是一個專業的 OCR 系統，專門識別展場地圖中的 booth 資訊。
+請仔細觀察圖片中的文字內容，提取出：
+1. Booth 名稱（公司名稱、產品名稱等）
+2. Booth 編號（如 A01, B-12, 123 等）
+3. 評估識別的信心度
+
+請只識別清晰可見的文字，不要推測或編造內容。
+如果圖片中沒有清晰的文字或只有背景圖案，請將 name 設為 null。"""
+
+# 解析 JSON 字串或 bytes（有 orjson 時使用 orjson；其錯誤型別是 json.JSONDecodeError 的子類別）
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+# 預設視覺模型（可用環境變數 OCR_MODEL 覆寫）；qwen2.5vl:3b 或 q4 量化版較快、可提高並行數，精度略低
+OCR_MODEL = os.environ.get("OCR_MODEL", "qwen2.5vl:7b")
+
+def _json_dumps_indent(obj) -> bytes:
+    """序列化為縮排 2 格的 UTF-8 JSON bytes（有 orjson 時使用 orjson）"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+
+# 模型在 Ollama 伺服器上的保留時間，每次請求都會刷新（可用環境變數 OCR_KEEP_ALIVE 覆寫）
+OCR_KEEP_ALIVE = os.environ.get("OCR_KEEP_ALIVE", "30m")
+
+# 送給模型的裁切圖最長邊（Qwen2.5-VL 的原生切片大小），更大的格子會先縮小
+MAX_CROP_SIDE = 896
+
+# 空白格子判定門檻：灰階標準差或 Canny 邊緣圖平均值（0-255）低於門檻時不送 VLM（可用環境變數覆寫）
+BLANK_STD_THRESHOLD = float(os.environ.get("OCR_BLANK_STD", 5.0))
+BLANK_EDGE_THRESHOLD = float(os.environ.get("OCR_BLANK_EDGE", 0.5))
+
+# 同時送出的 OCR 請求數（可用環境變數 OCR_CONCURRENCY 覆寫）
+OCR_CONCURRENCY = int(os.environ.get("OCR_CONCURRENCY", min(8, os.cpu_count() or 1)))
+# 並行裁切/編碼圖片的執行緒數（OpenCV 運算會釋放 GIL）
+OCR_PREP_WORKERS = int(os.environ.get("OCR_PREP_WORKERS", os.cpu_count() or 1))
+# 每次 chat 請求打包的格子數（可用環境變數 OCR_BATCH_SIZE 覆寫；1 為每格一次請求）
+OCR_BATCH_SIZE = int(os.environ.get("OCR_BATCH_SIZE", 1))
+
 
 class OCRResult:
     """OCR 識別結果"""
@@ -43,11 +91,38 @@ class OCRResult:
 class OllamaOCR:
     """Ollama OCR 處理器"""
     
-    def __init__(self, model_name: str = "qwen2.5vl:7b", crops_dir: str = "crops", check_connection: bool = True):
+    def __init__(self, model_name: str = OCR_MODEL, crops_dir: str = "crops", check_connection: bool = True,
+                 high_quality_denoise: bool = False, debug_dump_crops: bool = False,
+                 use_result_cache: bool = True, enhance: bool = False, crop_format: str = "jpg",
+                 skip_blank: bool = True):
         self.model_name = model_name
+        # 預設直接送彩色裁切圖（視覺模型以自然影像訓練，二值化反而降低辨識率）；開啟時走舊的灰階+二值化流程供 A/B 比較
+        self.enhance = enhance
+        self.high_quality_denoise = high_quality_denoise
+        # 送給 Ollama 的圖片格式："jpg"（q=90，編碼快、體積小）或 "png"；二值化圖與過小的圖一律用 PNG
+        self.crop_format = crop_format
+        # 空白裁切圖直接判定為無名稱，不呼叫模型；記錄被略過的格子 idx 供調整門檻
+        self.skip_blank = skip_blank
+        self.blank_cells = set()
+        # 並行處理時用來準備圖片的執行緒池（需要時才建立）
+        self._prep_pool = None
+        # 識別時圖片直接以記憶體中的編碼 bytes 傳給 Ollama；開啟時另外把裁切/優化圖存到 crops_dir 供檢查
+        self.debug_dump_crops = debug_dump_crops
         self.crops_dir = Path(crops_dir)
         self.crops_dir.mkdir(exist_ok=True)
         
+        # 來源大圖的解碼快取（只保留最近一張）
+        self._source_key = None
+        self._source_image = None
+        
+        # 以圖片內容雜湊為 key 的 OCR 結果快取（存於 crops_dir/.ocr_cache），像素未變的格子不必重新推論
+        self.use_result_cache = use_result_cache
+        self._result_cache = None
+        # 模型與提示詞不同時結果不可共用，一併放進 key 的前綴
+        self._cache_prefix = hashlib.blake2b(
+            f"{model_name}\0{SYSTEM_PROMPT}".encode('utf-8'), digest_size=16
+        ).digest()
+        
         # JSON Schema 定義
         self.json_schema = {
             "type": "object",
@@ -71,6 +146,9 @@ class OllamaOCR:
             "additionalProperties": False
         }
         
+        # 共用同一個 Client（連線池），不必每個格子重新建立 HTTP 連線；OLLAMA_HOST 可指定伺服器位址
+        self.client = ollama.Client(host=os.environ.get("OLLAMA_HOST"))
+        
         # 檢查 Ollama 連線
         if check_connection:
             self._check_ollama_connection()
@@ -78,7 +156,7 @@ class OllamaOCR:
     def _check_ollama_connection(self) -> bool:
         """檢查 Ollama 服務是否可用"""
         try:
-            models = ollama.list()
+            models = self.client.list()
             available_models = [model['name'] for model in models.get('models', [])]
             
             if self.model_name not in available_models:
@@ -87,12 +165,56 @@ class OllamaOCR:
                 return False
             
             logger.info(f"Ollama 連線成功，使用模型: {self.model_name}")
+            self._warmup()
             return True
             
         except Exception as e:
             logger.error(f"Ollama 連線失敗: {e}")
             return False
 
+    def _warmup(self):
+        """送出極短的請求預先載入模型，避免第一個格子承擔載入時間"""
+        try:
+            self.client.generate(model=self.model_name, prompt="ping",
+                                 keep_alive=OCR_KEEP_ALIVE, options={"num_predict": 1})
+        except Exception as e:
+            logger.warning(f"預載模型失敗: {e}")
+
+    def _load_source(self, source_image_path: str) -> Optional[np.ndarray]:
+        """讀取來源大圖，依 (路徑, mtime) 快取最近一張已解碼的圖片"""
+        try:
+            key = (os.path.abspath(source_image_path), os.path.getmtime(source_image_path))
+        except OSError:
+            return None
+        
+        if self._source_key != key:
+            image = cv2.imread(source_image_path, cv2.IMREAD_COLOR)
+            if image is None:
+                return None
+            self._source_key, self._source_image = key, image
+        return self._source_image
+
+    def _crop_array(self, cell: Cell, source_image_path: str) -> Optional[np.ndarray]:
+        """從大圖中裁切指定格子（含邊距）的區域，失敗時返回 None"""
+        # 讀取來源圖片（已解碼的大圖會快取，不必每格重新解碼 PNG）
+        image = self._load_source(source_image_path)
+        if image is None:
+            logger.error(f"無法讀取圖片: {source_image_path}")
+            return None
+        
+        # 裁切區域 (加一些邊距提高識別效果)
+        margin = 10
+        x1 = max(0, cell.x - margin)
+        y1 = max(0, cell.y - margin)
+        x2 = min(image.shape[1], cell.x + cell.w + margin)
+        y2 = min(image.shape[0], cell.y + cell.h + margin)
+        
+        cropped = image[y1:y2, x1:x2]
+        if cropped.size == 0:
+            logger.error(f"格子 {cell.idx} 的裁切區域在圖片範圍外")
+            return None
+        return cropped
+
     def crop_cell_image(self, cell: Cell, source_image_path: str = "large_map.png") -> Optional[str]:
         """
         從大圖中裁切指定格子的區域
@@ -105,21 +227,10 @@ class OllamaOCR:
             裁切後的圖片檔案路徑，失敗時返回 None
         """
         try:
-            # 讀取來源圖片
-            image = cv2.imread(source_image_path)
-            if image is None:
-                logger.error(f"無法讀取圖片: {source_image_path}")
+            cropped = self._crop_array(cell, source_image_path)
+            if cropped is None:
                 return None
             
-            # 裁切區域 (加一些邊距提高識別效果)
-            margin = 10
-            x1 = max(0, cell.x - margin)
-            y1 = max(0, cell.y - margin)
-            x2 = min(image.shape[1], cell.x + cell.w + margin)
-            y2 = min(image.shape[0], cell.y + cell.h + margin)
-            
-            cropped = image[y1:y2, x1:x2]
-            
             # 保存裁切圖片
             crop_filename = f"cell_{cell.idx}.png"
             crop_path = self.crops_dir / crop_filename
@@ -133,27 +244,28 @@ class OllamaOCR:
             logger.error(f"裁切格子 {cell.idx} 時發生錯誤: {e}")
             return None
 
-    def _enhance_image(self, image_path: str) -> str:
+    def _enhance_array(self, image: np.ndarray, high_quality: Optional[bool] = None) -> np.ndarray:
         """
-        優化圖片以提高 OCR 識別效果
+        優化圖片以提高 OCR 識別效果（灰階、去噪、自適應二值化、小圖放大）
         
         Args:
-            image_path: 原始圖片路徑
+            image: BGR 圖片
+            high_quality: 是否使用 Non-local Means 去噪（很慢，除錯用），None 時依建構參數
             
         Returns:
-            優化後圖片路徑
+            優化後的灰階圖片；失敗時返回原圖
         """
+        if high_quality is None:
+            high_quality = self.high_quality_denoise
         try:
-            # 讀取圖片
-            image = cv2.imread(image_path)
-            if image is None:
-                return image_path
-            
             # 轉為灰階
             gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
             
-            # 去噪
-            denoised = cv2.fastNlMeansDenoising(gray)
+            # 去噪：預設用 3x3 中值濾波（視覺模型不需要強力去噪），NLMeans 僅供除錯比較
+            if high_quality:
+                denoised = cv2.fastNlMeansDenoising(gray)
+            else:
+                denoised = cv2.medianBlur(gray, 3)
             
             # 自適應二值化
             binary = cv2.adaptiveThreshold(
@@ -161,55 +273,125 @@ class OllamaOCR:
                 cv2.THRESH_BINARY, 11, 2
             )
             
-            # 放大圖片以提高解析度
+            # 小圖放大以提高解析度，過大的圖縮到 MAX_CROP_SIDE
             height, width = binary.shape
-            if width < 200 or height < 200:
-                scale_factor = max(200 / width, 200 / height)
+            if max(width, height) > MAX_CROP_SIDE:
+                scale_factor = MAX_CROP_SIDE / max(width, height)
+                binary = cv2.resize(binary, (int(width * scale_factor), int(height * scale_factor)),
+                                    interpolation=cv2.INTER_AREA)
+            elif width < 200 or height < 200:
+                scale_factor = min(max(200 / width, 200 / height), MAX_CROP_SIDE / max(width, height))
                 new_width = int(width * scale_factor)
                 new_height = int(height * scale_factor)
-                binary = cv2.resize(binary, (new_width, new_height), interpolation=cv2.INTER_CUBIC)
-            
-            # 保存優化後圖片
-            enhanced_path = image_path.replace('.png', '_enhanced.png')
-            cv2.imwrite(enhanced_path, binary)
+                binary = cv2.resize(binary, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
             
-            return enhanced_path
+            return binary
             
         except Exception as e:
             logger.warning(f"圖片優化失敗: {e}")
-            return image_path
+            return image
 
-    def recognize_cell(self, cell: Cell, source_image_path: str = "large_map.png") -> OCRResult:
+    def _enhance_image(self, image_path: str, high_quality: Optional[bool] = None) -> Optional[np.ndarray]:
         """
-        識別單個格子的內容
+        讀取圖片檔並優化（不另存 *_enhanced.png）
         
         Args:
-            cell: 要識別的格子
-            source_image_path: 來源圖片路徑
+            image_path: 原始圖片路徑
+            high_quality: 是否使用 Non-local Means 去噪，None 時依建構參數
             
         Returns:
-            OCR 識別結果
+            優化後的圖片陣列，讀取失敗時返回 None
+        """
+        image = cv2.imread(image_path)
+        if image is None:
+            return None
+        return self._enhance_array(image, high_quality)
+
+    @staticmethod
+    def _fit_crop_size(image: np.ndarray) -> np.ndarray:
+        """
+        調整送給模型的裁切圖大小：最長邊超過 MAX_CROP_SIDE 時以 INTER_AREA 縮小，
+        短邊小於 200px 時放大 2 倍（不超過 MAX_CROP_SIDE），其餘原樣返回
+        """
+        height, width = image.shape[:2]
+        longest = max(height, width)
+        if longest > MAX_CROP_SIDE:
+            scale = MAX_CROP_SIDE / longest
+            return cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+        if min(height, width) < 200:
+            scale = min(2.0, MAX_CROP_SIDE / longest)
+            if scale > 1.0:
+                return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+        return image
+
+    @staticmethod
+    def _encode_png_bytes(image: np.ndarray) -> bytes:
+        """把圖片編碼成記憶體中的 PNG bytes"""
+        ok, buf = cv2.imencode('.png', image)
+        if not ok:
+            raise ValueError("PNG 編碼失敗")
+        return buf.tobytes()
+
+    def _encode_image_bytes(self, image: np.ndarray) -> bytes:
+        """依 crop_format 編碼送給 Ollama 的圖片；二值化圖或邊長小於 64px 時用 PNG 避免 JPEG 區塊雜訊"""
+        if self.crop_format != "jpg" or self.enhance or min(image.shape[:2]) < 64:
+            return self._encode_png_bytes(image)
+        ok, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90, cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+        if not ok:
+            raise ValueError("JPEG 編碼失敗")
+        return buf.tobytes()
+
+    def prepare_crops(self, cells: List[Cell], source_image_path: str = "large_map.png") -> List[Optional[np.ndarray]]:
+        """
+        一次讀取大圖並裁切多個格子
+        
+        Returns:
+            與 cells 順序相同的裁切圖（大圖的 view，不複製像素）；裁切失敗的格子為 None
+        """
+        crops = []
+        for cell in cells:
+            try:
+                crops.append(self._crop_array(cell, source_image_path))
+            except Exception as e:
+                logger.error(f"裁切格子 {cell.idx} 時發生錯誤: {e}")
+                crops.append(None)
+        return crops
+
+    def _prepare_image(self, cell: Cell, source_image_path: str,
+                       cropped: Optional[np.ndarray] = None) -> Optional[bytes]:
+        """
+        裁切（並視需要放大/優化）單個格子，回傳送給 Ollama 的圖片 bytes（不落地）
+        
+        Args:
+            cropped: 已由 prepare_crops 裁好的圖，None 時從 source_image_path 裁切
+        
+        Returns:
+            JPEG 或 PNG bytes，裁切失敗時返回 None
         """
         try:
-            # 裁切圖片
-            crop_path = self.crop_cell_image(cell, source_image_path)
-            if not crop_path:
-                return OCRResult(error="圖片裁切失敗")
+            if cropped is None:
+                cropped = self._crop_array(cell, source_image_path)
+            if cropped is None:
+                return None
+            if self.enhance:
+                enhanced = self._enhance_array(cropped)
+            else:
+                enhanced = self._fit_crop_size(cropped)
             
-            # 優化圖片
-            enhanced_path = self._enhance_image(crop_path)
+            if self.debug_dump_crops:
+                cv2.imwrite(str(self.crops_dir / f"cell_{cell.idx}.png"), cropped)
+                if enhanced is not cropped:
+                    cv2.imwrite(str(self.crops_dir / f"cell_{cell.idx}_enhanced.png"), enhanced)
             
-            # 準備 prompt
-            system_prompt = """你是一個專業的 OCR 系統，專門識別展場地圖中的 booth 資訊。
-請仔細觀察圖片中的文字內容，提取出：
-1. Booth 名稱（公司名稱、產品名稱等）
-2. Booth 編號（如 A01, B-12, 123 等）
-3. 評估識別的信心度
-
-請只識別清晰可見的文字，不要推測或編造內容。
-如果圖片中沒有清晰的文字或只有背景圖案，請將 name 設為 null。"""
+            return self._encode_image_bytes(enhanced)
+            
+        except Exception as e:
+            logger.error(f"裁切格子 {cell.idx} 時發生錯誤: {e}")
+            return None
 
-            user_prompt = f"""請識別這個 booth 區域的資訊。
+    def _build_messages(self, cell: Cell, image: bytes) -> List[Dict]:
+        """組出單個格子的 OCR 對話訊息"""
+        user_prompt = f"""請識別這個 booth 區域的資訊。
 返回 JSON 格式，包含：
 - name: booth 名稱（字符串，如果沒有清晰文字則為 null）
 - booth_id: booth 編號（字符串或 null）
@@ -217,57 +399,366 @@ class OllamaOCR:
 
 格子資訊：位置 ({cell.x}, {cell.y})，大小 {cell.w}x{cell.h}，類型：{cell.type}"""
 
-            # 呼叫 Ollama API
-            response = ollama.chat(
-                model=self.model_name,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": user_prompt,
-                        "images": [os.path.abspath(enhanced_path)]
-                    }
-                ],
-                format=self.json_schema,
-                options={
-                    "temperature": 0.1,  # 低溫度確保一致性
-                    "top_p": 0.9
-                }
+        return [
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": user_prompt,
+                "images": [image]
+            }
+        ]
+
+    def _build_batch_messages(self, cells: List[Cell], images: List[bytes]) -> List[Dict]:
+        """組出多個格子合併成一次請求的 OCR 對話訊息（第 k 張圖片對應第 k 個格子）"""
+        cell_lines = "\n".join(
+            f"{k}. 位置 ({cell.x}, {cell.y})，大小 {cell.w}x{cell.h}，類型：{cell.type}"
+            for k, cell in enumerate(cells, 1)
+        )
+        user_prompt = f"""以下附上 {len(cells)} 張 booth 區域圖片，請依圖片順序（第 1 張到第 {len(cells)} 張）分別識別。
+返回長度為 {len(cells)} 的 JSON 陣列，第 k 個元素對應第 k 張圖片，包含：
+- name: booth 名稱（字符串，如果沒有清晰文字則為 null）
+- booth_id: booth 編號（字符串或 null）
+- confidence: 識別信心度（0.0-1.0）
+
+格子資訊：
+{cell_lines}"""
+
+        return [
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": user_prompt,
+                "images": list(images)
+            }
+        ]
+
+    def _batch_schema(self, count: int) -> Dict:
+        """多格子請求的 JSON Schema：長度固定為 count 的結果陣列"""
+        return {"type": "array", "items": self.json_schema, "minItems": count, "maxItems": count}
+
+    def _chat_kwargs(self, messages: List[Dict], schema: Optional[Dict] = None) -> Dict:
+        """Ollama chat 呼叫參數（同步與非同步共用）"""
+        return dict(
+            model=self.model_name,
+            messages=messages,
+            format=schema or self.json_schema,
+            keep_alive=OCR_KEEP_ALIVE,
+            options={
+                "temperature": 0.1,  # 低溫度確保一致性
+                "top_p": 0.9
+            }
+        )
+
+    def _parse_response(self, response) -> OCRResult:
+        """解析 Ollama 回應為 OCRResult"""
+        try:
+            result_data = _json_loads(response['message']['content'])
+            
+            return OCRResult(
+                name=result_data.get('name'),
+                booth_id=result_data.get('booth_id'),
+                confidence=result_data.get('confidence', 0.0)
             )
             
+        except (json.JSONDecodeError, KeyError) as e:
+            logger.error(f"解析 OCR 回應失敗: {e}")
+            logger.error(f"原始回應: {response}")
+            return OCRResult(error=f"回應解析失敗: {e}")
+
+    def _parse_batch_response(self, response, count: int) -> Optional[List[OCRResult]]:
+        """解析多格子請求的回應；格式不符或數量不對時回傳 None（由呼叫端改為逐格識別）"""
+        try:
+            result_data = _json_loads(response['message']['content'])
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            logger.warning(f"解析批次 OCR 回應失敗，改為逐格識別: {e}")
+            return None
+        
+        if not isinstance(result_data, list) or len(result_data) != count or \
+                not all(isinstance(item, dict) for item in result_data):
+            logger.warning(f"批次 OCR 回應數量不符（預期 {count} 筆），改為逐格識別")
+            return None
+        
+        return [
+            OCRResult(
+                name=item.get('name'),
+                booth_id=item.get('booth_id'),
+                confidence=item.get('confidence', 0.0)
+            )
+            for item in result_data
+        ]
+
+    @staticmethod
+    def _is_blank(image: np.ndarray) -> bool:
+        """裁切圖是否幾乎沒有內容（顏色變化或邊緣都很少）"""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if gray.std() < BLANK_STD_THRESHOLD:
+            return True
+        return cv2.Canny(gray, 50, 150).mean() < BLANK_EDGE_THRESHOLD
+
+    def _prepare_payload(self, cell: Cell, source_image_path: str, cropped: Optional[np.ndarray] = None):
+        """
+        裁切、判斷空白並編碼單個格子的圖片（不碰結果快取，可在執行緒池中執行）
+        
+        Returns:
+            (image_bytes, result)：需要推論時 result 為 None；裁切失敗或空白格子時 result 即為結果
+        """
+        if cropped is None:
+            cropped = self.prepare_crops([cell], source_image_path)[0]
+        if cropped is None:
+            return None, OCRResult(error="圖片裁切失敗")
+        
+        if self.skip_blank and self._is_blank(cropped):
+            self.blank_cells.add(cell.idx)
+            logger.debug(f"格子 {cell.idx} 的裁切圖為空白，略過識別")
+            return None, OCRResult(confidence=1.0)
+        
+        image = self._prepare_image(cell, source_image_path, cropped)
+        if image is None:
+            return None, OCRResult(error="圖片裁切失敗")
+        return image, None
+
+    def _lookup_cached(self, cell: Cell, payload):
+        """
+        對已準備好的圖片查詢結果快取
+        
+        Returns:
+            (image_bytes, cache_key, result)：需要推論時 result 為 None；
+            裁切失敗、空白格子或快取命中時 result 即為結果
+        """
+        image, result = payload
+        if result is not None:
+            return None, None, result
+        
+        # 相同格子與像素已識別過時直接沿用結果
+        key = self._cache_key(cell, image)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return None, None, cached
+        return image, key, None
+
+    def _prepare_request(self, cell: Cell, source_image_path: str):
+        """準備單個格子的推論請求，回傳值同 _lookup_cached"""
+        return self._lookup_cached(cell, self._prepare_payload(cell, source_image_path))
+
+    def _prepare_payloads(self, cells: List[Cell], source_image_path: str) -> List[Tuple]:
+        """依序準備多個格子的圖片，回傳與 cells 順序相同的 _prepare_payload 結果"""
+        crops = self.prepare_crops(cells, source_image_path)
+        return [
+            self._prepare_payload(cell, source_image_path, cropped) if cropped is not None
+            else (None, OCRResult(error="圖片裁切失敗"))
+            for cell, cropped in zip(cells, crops)
+        ]
+
+    def _get_prep_pool(self) -> ThreadPoolExecutor:
+        """取得準備圖片用的執行緒池"""
+        if self._prep_pool is None:
+            self._prep_pool = ThreadPoolExecutor(max_workers=max(1, OCR_PREP_WORKERS),
+                                                 thread_name_prefix="ocr-prep")
+        return self._prep_pool
+
+    async def _prepare_payloads_async(self, cells: List[Cell], source_image_path: str) -> List[Tuple]:
+        """_prepare_payloads 的非同步版本：在執行緒池中準備，不阻塞 event loop"""
+        loop = asyncio.get_running_loop()
+        pool = self._get_prep_pool()
+        return await asyncio.gather(*(
+            loop.run_in_executor(pool, self._prepare_payload, cell, source_image_path)
+            for cell in cells
+        ))
+
+    def _cache_key(self, cell: Cell, image: bytes) -> str:
+        """OCR 結果快取的 key：模型/提示詞 + 格子資訊（會寫進 prompt）+ 圖片內容"""
+        h = hashlib.blake2b(self._cache_prefix, digest_size=16)
+        h.update(f"{cell.x},{cell.y},{cell.w},{cell.h},{cell.type}\0".encode('utf-8'))
+        h.update(image)
+        return h.hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[OCRResult]:
+        """查詢 OCR 結果快取，未命中時返回 None"""
+        if not self.use_result_cache:
+            return None
+        try:
+            if self._result_cache is None:
+                self._result_cache = shelve.open(str(self.crops_dir / ".ocr_cache"))
+            data = self._result_cache.get(key)
+        except Exception as e:
+            logger.warning(f"OCR 結果快取無法使用，停用快取: {e}")
+            self.use_result_cache = False
+            return None
+        if data is None:
+            return None
+        return OCRResult(
+            name=data.get('name'),
+            booth_id=data.get('booth_id'),
+            confidence=data.get('confidence', 0.0)
+        )
+
+    def _cache_put(self, key: str, result: OCRResult):
+        """寫入成功的 OCR 結果（失敗的結果不快取，下次會重試）"""
+        if not self.use_result_cache or result.error or self._result_cache is None:
+            return
+        try:
+            self._result_cache[key] = result.to_dict()
+        except Exception as e:
+            logger.warning(f"寫入 OCR 結果快取失敗: {e}")
+
+    def close(self):
+        """關閉 OCR 結果快取檔與執行緒池"""
+        if self._prep_pool is not None:
+            self._prep_pool.shutdown()
+            self._prep_pool = None
+        if self._result_cache is not None:
+            self._result_cache.close()
+            self._result_cache = None
+
+    def recognize_cell(self, cell: Cell, source_image_path: str = "large_map.png") -> OCRResult:
+        """
+        識別單個格子的內容
+        
+        Args:
+            cell: 要識別的格子
+            source_image_path: 來源圖片路徑
+            
+        Returns:
+            OCR 識別結果
+        """
+        try:
+            # 裁切並優化圖片（記憶體中的圖片 bytes）；裁切失敗、空白或快取命中時直接返回
+            image, key, result = self._prepare_request(cell, source_image_path)
+            if result is not None:
+                return result
+            
+            # 呼叫 Ollama API
+            response = self.client.chat(**self._chat_kwargs(self._build_messages(cell, image)))
+            
             # 解析回應
-            try:
-                result_text = response['message']['content']
-                result_data = json.loads(result_text)
-                
-                return OCRResult(
-                    name=result_data.get('name'),
-                    booth_id=result_data.get('booth_id'),
-                    confidence=result_data.get('confidence', 0.0)
-                )
-                
-            except (json.JSONDecodeError, KeyError) as e:
-                logger.error(f"解析 OCR 回應失敗: {e}")
-                logger.error(f"原始回應: {response}")
-                return OCRResult(error=f"回應解析失敗: {e}")
+            result = self._parse_response(response)
+            self._cache_put(key, result)
+            return result
                 
         except Exception as e:
             logger.error(f"OCR 識別格子 {cell.idx} 時發生錯誤: {e}")
             return OCRResult(error=str(e))
+
+    async def _recognize_cell_async(self, cell: Cell, source_image_path: str,
+                                    sem: asyncio.Semaphore, client) -> OCRResult:
+        """recognize_cell 的非同步版本：圖片在執行緒池中先準備好，再以 semaphore 限制同時送出的請求數"""
+        try:
+            payloads = await self._prepare_payloads_async([cell], source_image_path)
+            image, key, result = self._lookup_cached(cell, payloads[0])
+            if result is not None:
+                return result
+        except Exception as e:
+            logger.error(f"OCR 識別格子 {cell.idx} 時發生錯誤: {e}")
+            return OCRResult(error=str(e))
         
-        finally:
-            # 清理暫存檔案
+        async with sem:
             try:
-                if 'enhanced_path' in locals() and enhanced_path != crop_path:
-                    os.remove(enhanced_path)
-            except:
-                pass
+                response = await client.chat(**self._chat_kwargs(self._build_messages(cell, image)))
+                result = self._parse_response(response)
+                self._cache_put(key, result)
+                return result
+                
+            except Exception as e:
+                logger.error(f"OCR 識別格子 {cell.idx} 時發生錯誤: {e}")
+                return OCRResult(error=str(e))
+
+    def recognize_batch(self, cells: List[Cell], source_image_path: str = "large_map.png") -> List[OCRResult]:
+        """
+        以一次 chat 請求識別多個格子，回應無法對應時改為逐格識別
+        
+        Returns:
+            與 cells 順序相同的 OCR 識別結果
+        """
+        prepared, done, kwargs = self._start_batch(cells, self._prepare_payloads(cells, source_image_path))
+        try:
+            response = self.client.chat(**kwargs) if prepared else None
+        except Exception as e:
+            logger.warning(f"批次 OCR 請求失敗，改為逐格識別: {e}")
+            response = None
+        results = self._finish_batch(cells, prepared, done, response)
+        
+        if results is None:
+            results = [self.recognize_cell(cell, source_image_path) for cell in cells]
+        return results
+
+    async def _recognize_batch_async(self, cells: List[Cell], source_image_path: str,
+                                     sem: asyncio.Semaphore, client) -> List[OCRResult]:
+        """recognize_batch 的非同步版本（圖片在取得 semaphore 前於執行緒池中準備）"""
+        payloads = await self._prepare_payloads_async(cells, source_image_path)
+        async with sem:
+            prepared, done, kwargs = self._start_batch(cells, payloads)
+            try:
+                response = await client.chat(**kwargs) if prepared else None
+            except Exception as e:
+                logger.warning(f"批次 OCR 請求失敗，改為逐格識別: {e}")
+                response = None
+            results = self._finish_batch(cells, prepared, done, response)
+        
+        if results is None:
+            # 逐格識別會各自取得 semaphore，必須在釋放後才呼叫
+            results = [await self._recognize_cell_async(cell, source_image_path, sem, client) for cell in cells]
+        return results
+
+    def _start_batch(self, cells: List[Cell], payloads: List[Tuple]):
+        """
+        查詢快取並組出批次請求參數
+        
+        Returns:
+            (prepared, done, kwargs)：prepared 為需要推論的 [(cell, image_bytes, cache_key)]，
+            done 為已有結果的 {idx: OCRResult}（裁切失敗、空白格子或快取命中）
+        """
+        prepared, done = [], {}
+        for cell, payload in zip(cells, payloads):
+            image, key, result = self._lookup_cached(cell, payload)
+            if result is not None:
+                done[cell.idx] = result
+            else:
+                prepared.append((cell, image, key))
+        kwargs = self._chat_kwargs(
+            self._build_batch_messages([cell for cell, _, _ in prepared], [image for _, image, _ in prepared]),
+            self._batch_schema(len(prepared))
+        )
+        return prepared, done, kwargs
+
+    def _finish_batch(self, cells: List[Cell], prepared, done, response) -> Optional[List[OCRResult]]:
+        """
+        把批次回應對回 cells 的順序
+        
+        Returns:
+            與 cells 順序相同的結果；回應缺失或無法對應時回傳 None
+        """
+        if not prepared:
+            parsed = []
+        elif response is None:
+            return None
+        else:
+            parsed = self._parse_batch_response(response, len(prepared))
+            if parsed is None:
+                return None
+        
+        by_idx = dict(done)
+        for (cell, _, key), result in zip(prepared, parsed):
+            self._cache_put(key, result)
+            by_idx[cell.idx] = result
+        return [by_idx[cell.idx] for cell in cells]
+
+    def _log_result(self, cell: Cell, result: OCRResult):
+        """輸出單個格子的識別結果"""
+        if result.error:
+            logger.warning(f"格子 {cell.idx} 識別失敗: {result.error}")
+        else:
+            logger.info(f"格子 {cell.idx} 識別結果: name='{result.name}', booth_id='{result.booth_id}', confidence={result.confidence:.2f}")
 
     def process_cells(self, cells: List[Cell], target_types: List[str] = None, 
-                     source_image_path: str = "large_map.png") -> Dict[int, OCRResult]:
+                     source_image_path: str = "large_map.png",
+                     concurrency: Optional[int] = None,
+                     batch_size: Optional[int] = None) -> Dict[int, OCRResult]:
         """
         批次處理多個格子
         
@@ -275,64 +766,155 @@ class OllamaOCR:
             cells: 要處理的格子列表
             target_types: 要處理的格子類型，None 表示處理 booth 和 unknown
             source_image_path: 來源圖片路徑
+            concurrency: 同時送出的 OCR 請求數，None 時使用 OCR_CONCURRENCY；1 為逐一處理
+            batch_size: 每次請求打包的格子數，None 時使用 OCR_BATCH_SIZE；1 為每格一次請求
             
         Returns:
             格子 idx 到 OCR 結果的映射
         """
         if target_types is None:
             target_types = ["booth", "unknown"]
+        if concurrency is None:
+            concurrency = OCR_CONCURRENCY
+        if batch_size is None:
+            batch_size = OCR_BATCH_SIZE
+        batch_size = max(1, batch_size)
         
         # 過濾需要處理的格子
-        target_cells = [cell for cell in cells if cell.type in target_types]
+        type_set = set(target_types)
+        target_cells = [cell for cell in cells if cell.type in type_set]
         
-        logger.info(f"開始處理 {len(target_cells)} 個格子 (類型: {target_types})")
+        # 打包時依面積排序，讓同一批的裁切圖大小相近（視覺編碼器的 patch 數較一致）
+        ordered = sorted(target_cells, key=lambda cell: cell.w * cell.h) if batch_size > 1 else target_cells
+        batches = [ordered[i:i + batch_size] for i in range(0, len(ordered), batch_size)]
         
+        logger.info(f"開始處理 {len(target_cells)} 個格子 (類型: {target_types}，"
+                    f"並行數: {concurrency}，每批: {batch_size})")
+        
+        # 呼叫端已有執行中的 event loop（如 Jupyter）時無法 asyncio.run，改走逐批處理
+        if concurrency > 1 and len(batches) > 1:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            else:
+                logger.info("偵測到執行中的 event loop，改為逐一處理（可直接 await process_cells_async 以並行）")
+                concurrency = 1
+        
+        self.blank_cells.clear()
+        try:
+            if concurrency > 1 and len(batches) > 1:
+                results = asyncio.run(self.process_cells_async(ordered, source_image_path, concurrency, batch_size))
+            else:
+                results = self._process_batches(batches, len(target_cells), source_image_path)
+        finally:
+            # 中斷時也把已完成的結果寫入快取檔；快取檔與執行緒池下次使用時會重新開啟
+            self.close()
+        
+        if self.blank_cells:
+            logger.info(f"略過 {len(self.blank_cells)} 個空白格子（門檻：標準差 < {BLANK_STD_THRESHOLD}，"
+                        f"邊緣平均 < {BLANK_EDGE_THRESHOLD}）")
+        
+        # 結果依原本的格子順序輸出
+        return {cell.idx: results[cell.idx] for cell in target_cells}
+
+    def _process_batches(self, batches: List[List[Cell]], total: int, source_image_path: str) -> Dict[int, OCRResult]:
+        """逐批依序處理（不並行）"""
         results = {}
+        done = 0
         
-        for i, cell in enumerate(target_cells, 1):
-            logger.info(f"處理進度: {i}/{len(target_cells)} - 格子 {cell.idx} (類型: {cell.type})")
+        for batch in batches:
+            logger.info(f"處理進度: {done + len(batch)}/{total} - 格子 "
+                        f"{', '.join(str(cell.idx) for cell in batch)}")
             
-            result = self.recognize_cell(cell, source_image_path)
-            results[cell.idx] = result
+            if len(batch) == 1:
+                batch_results = [self.recognize_cell(batch[0], source_image_path)]
+            else:
+                batch_results = self.recognize_batch(batch, source_image_path)
             
             # 輸出結果
-            if result.error:
-                logger.warning(f"格子 {cell.idx} 識別失敗: {result.error}")
-            else:
-                logger.info(f"格子 {cell.idx} 識別結果: name='{result.name}', booth_id='{result.booth_id}', confidence={result.confidence:.2f}")
+            for cell, result in zip(batch, batch_results):
+                results[cell.idx] = result
+                self._log_result(cell, result)
+            done += len(batch)
         
         return results
 
+    async def process_cells_async(self, target_cells: List[Cell], source_image_path: str = "large_map.png",
+                                  concurrency: int = None, batch_size: int = 1) -> Dict[int, OCRResult]:
+        """
+        並行處理已過濾的格子（Ollama 伺服器端需設定 OLLAMA_NUM_PARALLEL 才會真正並行推論）
+        
+        Returns:
+            格子 idx 到 OCR 結果的映射，順序與 target_cells 相同
+        """
+        try:
+            return await self._process_cells_async(target_cells, source_image_path, concurrency, batch_size)
+        finally:
+            # 直接呼叫本方法時也要釋放快取檔與執行緒池（下次使用時會重新開啟）
+            self.close()
+
+    async def _process_cells_async(self, target_cells: List[Cell], source_image_path: str,
+                                   concurrency: Optional[int], batch_size: int) -> Dict[int, OCRResult]:
+        """process_cells_async 的主體"""
+        sem = asyncio.Semaphore(concurrency or OCR_CONCURRENCY)
+        # AsyncClient 綁定目前的 event loop，每次 asyncio.run 建一個，由所有任務共用
+        client = ollama.AsyncClient(host=os.environ.get("OLLAMA_HOST"))
+        batch_size = max(1, batch_size or 1)
+        batches = [target_cells[i:i + batch_size] for i in range(0, len(target_cells), batch_size)]
+        done = 0
+        # 先解碼來源大圖，避免多個執行緒同時讀取同一張大圖
+        self._load_source(source_image_path)
+        
+        async def run(batch: List[Cell]) -> List[OCRResult]:
+            nonlocal done
+            if len(batch) == 1:
+                batch_results = [await self._recognize_cell_async(batch[0], source_image_path, sem, client)]
+            else:
+                batch_results = await self._recognize_batch_async(batch, source_image_path, sem, client)
+            done += len(batch)
+            logger.info(f"處理進度: {done}/{len(target_cells)} - 格子 "
+                        f"{', '.join(str(cell.idx) for cell in batch)}")
+            for cell, result in zip(batch, batch_results):
+                self._log_result(cell, result)
+            return batch_results
+        
+        batch_results = await asyncio.gather(*(run(batch) for batch in batches))
+        return {cell.idx: result
+                for batch, results in zip(batches, batch_results)
+                for cell, result in zip(batch, results)}
+
     def update_grid_with_ocr_results(self, cells: List[Cell], ocr_results: Dict[int, OCRResult]) -> List[Cell]:
         """
-        使用 OCR 結果更新格子資料
+        使用 OCR 結果更新格子資料（就地修改 cells 中的格子）
         
         Args:
             cells: 原始格子列表
             ocr_results: OCR 識別結果
             
         Returns:
-            更新後的格子列表
+            更新後的格子列表（即傳入的 cells）
         """
-        updated_cells = []
+        idx_map = build_idx_map(cells)
         updated_count = 0
         
-        for cell in cells:
-            if cell.idx in ocr_results:
-                result = ocr_results[cell.idx]
-                
-                if not result.error and result.name and result.confidence > 0.3:
-                    # 更新格子資訊
-                    cell.name = result.name
-                    if result.booth_id:
-                        cell.booth_id = result.booth_id
-                    updated_count += 1
-                    logger.debug(f"已更新格子 {cell.idx}: name='{cell.name}', booth_id='{cell.booth_id}'")
+        # 只走訪有 OCR 結果的格子
+        for idx, result in ocr_results.items():
+            pos = idx_map.get(idx)
+            if pos is None:
+                continue
             
-            updated_cells.append(cell)
+            if not result.error and result.name and result.confidence > 0.3:
+                # 更新格子資訊
+                cell = cells[pos]
+                cell.name = result.name
+                if result.booth_id:
+                    cell.booth_id = result.booth_id
+                updated_count += 1
+                logger.debug(f"已更新格子 {cell.idx}: name='{cell.name}', booth_id='{cell.booth_id}'")
         
         logger.info(f"成功更新 {updated_count} 個格子的資訊")
-        return updated_cells
+        return cells
 
     def save_ocr_results(self, ocr_results: Dict[int, OCRResult], output_path: str = "data/ocr_results.json"):
         """
@@ -342,17 +924,21 @@ class OllamaOCR:
             ocr_results: OCR 識別結果
             output_path: 輸出檔案路徑
         """
-        # 轉換為可序列化的格式
-        serializable_results = {
-            idx: result.to_dict() for idx, result in ocr_results.items()
-        }
-        
         # 確保目錄存在
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
-        # 保存結果
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(serializable_results, f, indent=2, ensure_ascii=False)
+        # 逐筆寫入（格式與 json.dump(indent=2) 相同），不必先組出整個可序列化的 dict
+        with open(output_path, 'wb') as f:
+            if not ocr_results:
+                f.write(b"{}")
+            else:
+                sep = b"{\n"
+                for idx, result in ocr_results.items():
+                    f.write(sep)
+                    f.write(f'  "{idx}": '.encode('utf-8'))
+                    f.write(_json_dumps_indent(result.to_dict()).replace(b"\n", b"\n  "))
+                    sep = b",\n"
+                f.write(b"\n}")
         
         logger.info(f"OCR 結果已保存到: {output_path}")
 
@@ -367,8 +953,8 @@ class OllamaOCR:
             OCR 識別結果
         """
         try:
-            with open(input_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(input_path, 'rb') as f:
+                data = _json_loads(f.read())
             
             results = {}
             for idx_str, result_data in data.items():
@@ -393,6 +979,11 @@ class OllamaOCR:
 
 def main():
     """主函數 - 示例用法"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Ollama OCR 示例：識別前 5 個 booth 格子")
+    parser.add_argument("--model", default=OCR_MODEL, help="Ollama 模型名稱")
+    args = parser.parse_args()
+    
     # 載入格子資料
     cells = load_grid()
     if not cells:
@@ -400,7 +991,7 @@ def main():
         return
     
     # 建立 OCR 處理器
-    ocr = OllamaOCR()
+    ocr = OllamaOCR(model_name=args.model)
     
     # 只處理前 5 個 booth 格子進行測試
     booth_cells = [cell for cell in cells if cell.type == "booth"][:5]
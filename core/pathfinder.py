@@ -10,14 +10,28 @@
 """
 
 import json
+import math
 import numpy as np
 import heapq
 import sys
 import os
+from collections import OrderedDict
 from typing import List, Dict, Tuple, Optional, Union
 from dataclasses import dataclass
 from pathlib import Path
 
+# 斜向一步的距離（模組常數，避免每次展開都呼叫 np.sqrt）
+SQRT2 = math.sqrt(2.0)
+
+# _heuristic_table 整張預算表的上限（目標數 x 網格格數），超過時改為展開時才逐點計算
+HEURISTIC_TABLE_MAX_CELLS = 2_000_000
+
+# 起終點 Chebyshev 距離達此值（unit 格）且無轉彎成本時，astar_auto 改用雙向 A*
+BIDIRECTIONAL_MIN_DIST = 50
+
+# find_route 最多保留幾個 PathfindingGrid（同一份平面圖的重複查詢可直接重用）
+GRID_CACHE_SIZE = 4
+
 # 將專案根目錄加到 Python 路徑中（供直接執行使用）
 if __name__ == "__main__":
     current_dir = os.path.dirname(__file__)
@@ -26,17 +40,30 @@ if __name__ == "__main__":
         sys.path.append(project_root)
 
 try:
-    from .grid import Cell, load_grid, load_grid_meta
+    from .grid import Cell, CELL_DTYPE, cells_to_array, load_grid, load_grid_meta
 except ImportError:
-    from core.grid import Cell, load_grid, load_grid_meta
+    from core.grid import Cell, CELL_DTYPE, cells_to_array, load_grid, load_grid_meta
 
+try:
+    from numba import njit  # 選用：JIT 編譯 A* 主迴圈
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
 
-@dataclass
+    def njit(*args, **kwargs):
+        """沒有 numba 時的替代裝飾器：直接回傳原函式"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+
+@dataclass(frozen=True)
 class PathfindingOptions:
     """路徑計算選項配置"""
     allow_diag: bool = False        # 是否允許斜向移動（預設為 False，僅 4 向）
     turn_weight: float = 0.0        # 轉彎額外成本（預設 0，不加彎折成本）
     allow_enter_area: bool = False  # 是否允許進入大區域（沿用舊邏輯）
+    jps: bool = False               # 成本均一時以 Jump Point Search 取代逐格展開（需 allow_diag）
 
 
 @dataclass
@@ -68,23 +95,46 @@ class PathfindingGrid:
         
         # 建立矩陣
         self.walkable, self.cost, self.cell_map = self._build_matrices()
+        
+        # 可行走格中的最小成本，作為啟發式函數的比例（保證不高估）
+        self._min_cost = float(self.cost[self.walkable].min()) if self.walkable.any() else 1.0
+        # 所有可行走格成本相同時才能使用 JPS（跳躍的成本 = 步數 x 單格成本）
+        self._uniform_cost = bool(self.walkable.any()) and float(self.cost[self.walkable].max()) == self._min_cost
+        self._walkable_pad = None
+        
+        # cost 的量化版本給 numba kernel 用：每格只存成本等級編號 (uint8/uint16)，
+        # 實際成本查 _cost_levels，數值與 cost 完全相同，但矩陣只佔 1/8 (或 1/4) 的頻寬
+        levels, codes = np.unique(self.cost, return_inverse=True)
+        self._cost_levels = levels.astype(np.float64)
+        self._cost_code = codes.reshape(self.cost.shape).astype(np.uint8 if len(levels) <= 256 else np.uint16)
+        
+        # find_walkable_candidates 的結果（booth idx -> 候選點），第一次查詢時建立
+        self._candidates = {}
+        
+        # 可行走格座標（find_walkable_near_booth 的備援搜尋用，需要時才建立）
+        self._walkable_rc = None
+        
+        # A* 搜尋用的平面陣列（以 row * grid_width + col 為索引），只配置一次，每次搜尋後重設
+        n = self.grid_height * self.grid_width
+        self._g = np.full(n, np.inf)                     # g 值
+        self._came = np.full(n, -1, dtype=np.int32)      # 前一個節點的平面索引，-1 表示無
+        self._came_dir = np.zeros(n, dtype=np.uint8)     # 進入該節點時的方向編號
+        self._g_back = np.full(n, np.inf)                # 雙向搜尋：反向 (由終點出發) 的 g 值
+        self._came_back = np.full(n, -1, dtype=np.int32) # 雙向搜尋：反向的下一個節點（往終點方向）
     
     def _calculate_grid_bounds(self):
         """計算網格邊界"""
-        all_cols = []
-        all_rows = []
+        # 以 SoA 陣列一次取得所有 cell 的範圍；寬高 <= 0 的 cell 不佔任何 unit 格
+        self._cell_arr = cells_to_array(self.cells) if self.cells else np.zeros(0, dtype=CELL_DTYPE)
+        arr = self._cell_arr[(self._cell_arr['unit_w'] > 0) & (self._cell_arr['unit_h'] > 0)]
         
-        for cell in self.cells:
-            # 計算該 cell 佔據的所有 unit 格
-            for dc in range(cell.unit_w):
-                for dr in range(cell.unit_h):
-                    all_cols.append(cell.col + dc)
-                    all_rows.append(cell.row + dr)
-        
-        self.min_col = min(all_cols) if all_cols else 0
-        self.max_col = max(all_cols) if all_cols else 0
-        self.min_row = min(all_rows) if all_rows else 0
-        self.max_row = max(all_rows) if all_rows else 0
+        if len(arr):
+            self.min_col = int(arr['col'].min())
+            self.max_col = int((arr['col'] + arr['unit_w'] - 1).max())
+            self.min_row = int(arr['row'].min())
+            self.max_row = int((arr['row'] + arr['unit_h'] - 1).max())
+        else:
+            self.min_col = self.max_col = self.min_row = self.max_row = 0
         
         self.grid_width = self.max_col - self.min_col + 1
         self.grid_height = self.max_row - self.min_row + 1
@@ -99,9 +149,17 @@ class PathfindingGrid:
         cost = np.ones((self.grid_height, self.grid_width), dtype=float)
         cell_map = np.full((self.grid_height, self.grid_width), -1, dtype=int)  # -1 表示無 cell
         
-        # 填入每個 cell 的資訊
-        for cell in self.cells:
-            cell_type = cell.type
+        # 類型編號：第 i 個 cell 的類型為 _cell_type_code[i]（依首次出現順序編號）
+        type_codes = {}
+        self._cell_type_code = np.fromiter(
+            (type_codes.setdefault(cell.type, len(type_codes)) for cell in self.cells),
+            dtype=np.int32, count=len(self.cells)
+        )
+        
+        # 以類型編號索引的屬性查表，每種類型只查一次 grid_types
+        walkable_lut = np.ones(len(type_codes), dtype=bool)
+        cost_lut = np.ones(len(type_codes), dtype=float)
+        for cell_type, code in type_codes.items():
             type_info = self.grid_types.get(cell_type, {})
             
             # 取得基本屬性
@@ -112,19 +170,24 @@ class PathfindingGrid:
             if self.allow_enter_area and cell_type in ['exp hall', 'stage', 'Lounge']:
                 is_walkable = True
                 cell_cost = max(cell_cost, 2.0)  # 至少 2.0 的成本
-            
-            # 填入該 cell 佔據的所有 unit 格
-            for dc in range(cell.unit_w):
-                for dr in range(cell.unit_h):
-                    grid_col = cell.col + dc - self.min_col
-                    grid_row = cell.row + dr - self.min_row
-                    
-                    if 0 <= grid_col < self.grid_width and 0 <= grid_row < self.grid_height:
-                        # 只有明確標記為不可行走的才設為 False
-                        if not is_walkable:
-                            walkable[grid_row, grid_col] = False
-                        cost[grid_row, grid_col] = cell_cost
-                        cell_map[grid_row, grid_col] = cell.idx
+            walkable_lut[code] = bool(is_walkable)
+            cost_lut[code] = cell_cost
+        
+        # 以切片整塊填入每個 cell 佔據的 unit 格（邊界已涵蓋所有 cell，不需逐格檢查）
+        arr = self._cell_arr
+        cell_walkable = walkable_lut[self._cell_type_code].tolist()
+        cell_costs = cost_lut[self._cell_type_code].tolist()
+        for idx, c0, r0, w, h, is_walkable, cell_cost in zip(
+                arr['idx'].tolist(), (arr['col'] - self.min_col).tolist(), (arr['row'] - self.min_row).tolist(),
+                arr['unit_w'].tolist(), arr['unit_h'].tolist(), cell_walkable, cell_costs):
+            if w <= 0 or h <= 0:
+                continue
+            block = (slice(r0, r0 + h), slice(c0, c0 + w))
+            # 只有明確標記為不可行走的才設為 False
+            if not is_walkable:
+                walkable[block] = False
+            cost[block] = cell_cost
+            cell_map[block] = idx
         
         return walkable, cost, cell_map
     
@@ -141,105 +204,78 @@ class PathfindingGrid:
         return col, row
     
     def find_walkable_candidates(self, booth_idx: int) -> List[Tuple[int, int]]:
-        """找出 booth 周圍所有可行走的邊界點"""
+        """找出 booth 周圍所有可行走的邊界點（結果依 booth idx 快取）"""
         if booth_idx not in self.cell_by_idx:
             return []
+        if booth_idx in self._candidates:
+            return list(self._candidates[booth_idx])
         
         booth = self.cell_by_idx[booth_idx]
-        candidates = []
         
-        # booth 佔據的範圍
-        min_col, max_col = booth.col, booth.col + booth.unit_w - 1
-        min_row, max_row = booth.row, booth.row + booth.unit_h - 1
+        # booth 外擴一格的外框（矩陣座標，上界不含），裁切到網格範圍內
+        row_lo = booth.row - self.min_row - 1
+        row_hi = row_lo + booth.unit_h + 2
+        col_lo = booth.col - self.min_col - 1
+        col_hi = col_lo + booth.unit_w + 2
+        r0, r1 = max(row_lo, 0), min(row_hi, self.grid_height)
+        c0, c1 = max(col_lo, 0), min(col_hi, self.grid_width)
+        if r0 >= r1 or c0 >= c1:
+            self._candidates[booth_idx] = []
+            return []
         
-        # 檢查 booth 四周的相鄰格子
-        for col in range(min_col - 1, max_col + 2):
-            for row in range(min_row - 1, max_row + 2):
-                # 跳過 booth 內部的格子
-                if min_col <= col <= max_col and min_row <= row <= max_row:
-                    continue
-                
-                # 轉換為矩陣座標並檢查是否可行走
-                matrix_row, matrix_col = self.grid_to_matrix(col, row)
-                if (0 <= matrix_row < self.grid_height and 
-                    0 <= matrix_col < self.grid_width and 
-                    self.walkable[matrix_row, matrix_col]):
-                    candidates.append((col, row))
+        # 取出外框內的 walkable，挖掉 booth 內部，只留四周一圈
+        ring = self.walkable[r0:r1, c0:c1].copy()
+        inner_r0 = max(row_lo + 1, r0) - r0
+        inner_c0 = max(col_lo + 1, c0) - c0
+        ring[inner_r0:max(min(row_hi - 1, r1) - r0, inner_r0),
+             inner_c0:max(min(col_hi - 1, c1) - c0, inner_c0)] = False
         
-        return candidates
+        # 轉置後 nonzero 為先 col 後 row 的順序，與原本逐格掃描相同
+        cols, rows = np.nonzero(ring.T)
+        candidates = list(zip((cols + c0 + self.min_col).tolist(), (rows + r0 + self.min_row).tolist()))
+        
+        self._candidates[booth_idx] = candidates
+        return list(candidates)
     
     def find_walkable_near_booth(self, booth_idx: int) -> Optional[Tuple[int, int]]:
-        """找到 booth 附近最近的可行走點（8向BFS）"""
+        """找到 booth 附近最近的可行走點（先找相鄰邊界點，否則取離中心最近的可行走格）"""
         if booth_idx not in self.cell_by_idx:
             return None
         
         booth = self.cell_by_idx[booth_idx]
         
-        # 先檢查 booth 周圍的所有邊界點
-        candidates = []
-        
-        # booth 佔據的範圍
-        min_col, max_col = booth.col, booth.col + booth.unit_w - 1
-        min_row, max_row = booth.row, booth.row + booth.unit_h - 1
-        
-        # 檢查 booth 四周的相鄰格子
-        for col in range(min_col - 1, max_col + 2):
-            for row in range(min_row - 1, max_row + 2):
-                # 跳過 booth 內部的格子
-                if min_col <= col <= max_col and min_row <= row <= max_row:
-                    continue
-                
-                # 轉換為矩陣座標並檢查是否可行走
-                matrix_row, matrix_col = self.grid_to_matrix(col, row)
-                if (0 <= matrix_row < self.grid_height and 
-                    0 <= matrix_col < self.grid_width and 
-                    self.walkable[matrix_row, matrix_col]):
-                    
-                    # 計算到 booth 中心的距離
-                    center_col = booth.col + booth.unit_w / 2
-                    center_row = booth.row + booth.unit_h / 2
-                    distance = ((col - center_col) ** 2 + (row - center_row) ** 2) ** 0.5
-                    candidates.append((distance, col, row))
-        
+        # 先檢查 booth 周圍的所有邊界點（沿用 find_walkable_candidates 的外框遮罩與快取）
+        candidates = self.find_walkable_candidates(booth_idx)
         if candidates:
-            # 回傳距離最近的可行走點
-            candidates.sort()
-            _, closest_col, closest_row = candidates[0]
+            # 回傳離 booth 中心最近的可行走點（同距離時取 col、row 較小者）
+            center_col = booth.col + booth.unit_w / 2
+            center_row = booth.row + booth.unit_h / 2
+            _, closest_col, closest_row = min(
+                (((col - center_col) ** 2 + (row - center_row) ** 2) ** 0.5, col, row)
+                for col, row in candidates
+            )
             return closest_col, closest_row
         
-        # 如果沒有找到相鄰的可行走點，使用較大範圍的 BFS
+        # 如果沒有找到相鄰的可行走點，直接在所有可行走格中找離 booth 中心最近的一格
         center_col = booth.col + booth.unit_w // 2
         center_row = booth.row + booth.unit_h // 2
         start_matrix_row, start_matrix_col = self.grid_to_matrix(center_col, center_row)
         
-        # 8 向搜尋
-        directions = [(-1,-1), (-1,0), (-1,1), (0,-1), (0,1), (1,-1), (1,0), (1,1)]
-        queue = [(start_matrix_row, start_matrix_col, 0)]  # (row, col, distance)
-        visited = set()
-        
-        while queue:
-            curr_row, curr_col, dist = queue.pop(0)
-            
-            if (curr_row, curr_col) in visited:
-                continue
-            visited.add((curr_row, curr_col))
-            
-            # 檢查邊界
-            if not (0 <= curr_row < self.grid_height and 0 <= curr_col < self.grid_width):
-                continue
-            
-            # 如果是可行走的，回傳網格座標
-            if self.walkable[curr_row, curr_col]:
-                grid_col, grid_row = self.matrix_to_grid(curr_row, curr_col)
-                return grid_col, grid_row
-            
-            # 擴展鄰居
-            for dr, dc in directions:
-                new_row, new_col = curr_row + dr, curr_col + dc
-                if (new_row, new_col) not in visited:
-                    queue.append((new_row, new_col, dist + 1))
+        walkable_rc = self._walkable_coords()
+        if len(walkable_rc) == 0:
+            return None
         
-        return None
+        # 歐幾里得距離平方最小者（同距離時取 row-major 順序的第一個）
+        d_row = walkable_rc[:, 0] - start_matrix_row
+        d_col = walkable_rc[:, 1] - start_matrix_col
+        nearest_row, nearest_col = walkable_rc[np.argmin(d_row * d_row + d_col * d_col)]
+        return self.matrix_to_grid(int(nearest_row), int(nearest_col))
+    
+    def _walkable_coords(self) -> np.ndarray:
+        """所有可行走格的 (row, col) 矩陣座標，(K, 2) 陣列，第一次使用時建立"""
+        if self._walkable_rc is None:
+            self._walkable_rc = np.argwhere(self.walkable)
+        return self._walkable_rc
     
     def astar_multi(self, start_nodes: List[Tuple[int, int]], goal_set: set) -> Optional[RouteResult]:
         """
@@ -255,47 +291,48 @@ class PathfindingGrid:
         if not start_nodes or not goal_set:
             return None
         
-        # 轉換為矩陣座標
+        # 轉換為矩陣座標（熱點路徑：屬性先綁到區域變數，座標轉換直接展開）
+        H, W = self.grid_height, self.grid_width
+        min_row, min_col = self.min_row, self.min_col
+        walkable, cost = self.walkable, self.cost
+        allow_diag, turn_weight = self.options.allow_diag, self.options.turn_weight
         start_matrix_nodes = []
         goal_matrix_set = set()
         
         for col, row in start_nodes:
-            matrix_row, matrix_col = self.grid_to_matrix(col, row)
-            if (0 <= matrix_row < self.grid_height and 
-                0 <= matrix_col < self.grid_width and 
-                self.walkable[matrix_row, matrix_col]):
+            matrix_row, matrix_col = row - min_row, col - min_col
+            if 0 <= matrix_row < H and 0 <= matrix_col < W and walkable[matrix_row, matrix_col]:
                 start_matrix_nodes.append((matrix_row, matrix_col))
         
         for col, row in goal_set:
-            matrix_row, matrix_col = self.grid_to_matrix(col, row)
-            if (0 <= matrix_row < self.grid_height and 
-                0 <= matrix_col < self.grid_width and 
-                self.walkable[matrix_row, matrix_col]):
+            matrix_row, matrix_col = row - min_row, col - min_col
+            if 0 <= matrix_row < H and 0 <= matrix_col < W and walkable[matrix_row, matrix_col]:
                 goal_matrix_set.add((matrix_row, matrix_col))
         
         if not start_matrix_nodes or not goal_matrix_set:
             return None
         
-        # A* 演算法初始化
-        open_set = []
-        came_from = {}  # (row, col) -> (prev_row, prev_col, prev_dir)
-        g_score = {}
-        f_score = {}
+        if self.options.jps and allow_diag and turn_weight <= 0 and self._uniform_cost:
+            return self._astar_multi_jps(start_matrix_nodes, goal_matrix_set)
         
-        # 初始化所有起點
-        for matrix_row, matrix_col in start_matrix_nodes:
-            pos = (matrix_row, matrix_col)
-            g_score[pos] = 0
-            f_score[pos] = self._heuristic_to_goal_set(matrix_row, matrix_col, goal_matrix_set)
-            heapq.heappush(open_set, (f_score[pos], matrix_row, matrix_col))
+        if HAVE_NUMBA:
+            return self._astar_multi_nb(start_matrix_nodes, goal_matrix_set)
+        
+        # A* 演算法初始化（heap 內為 (f, 平面索引, g)，排序與 (f, row, col) 相同；
+        # g 只用來辨識過期項目：同一節點的 g 已被更新時，舊項目出堆後直接略過）
+        g_score, came_from, came_dir = self._g, self._came, self._came_dir
+        goal_mask = self._goal_mask(goal_matrix_set)
+        h_table = self._heuristic_table(goal_matrix_set)
+        open_set = []
+        touched = []
         
         # 決定移動方向
-        if self.options.allow_diag:
+        if allow_diag:
             # 8 向移動
             directions = [
-                (-1,-1, np.sqrt(2)), (-1,0, 1), (-1,1, np.sqrt(2)),
+                (-1,-1, SQRT2), (-1,0, 1), (-1,1, SQRT2),
                 (0,-1, 1),                      (0,1, 1),
-                (1,-1, np.sqrt(2)),  (1,0, 1),  (1,1, np.sqrt(2))
+                (1,-1, SQRT2),  (1,0, 1),  (1,1, SQRT2)
             ]
         else:
             # 4 向移動
@@ -303,166 +340,474 @@ class PathfindingGrid:
                 (-1,0, 1), (0,-1, 1), (0,1, 1), (1,0, 1)
             ]
         
-        while open_set:
-            current_f, current_row, current_col = heapq.heappop(open_set)
-            current_pos = (current_row, current_col)
-            
-            # 找到目標
-            if current_pos in goal_matrix_set:
-                path = self._reconstruct_path_with_direction(came_from, current_pos)
-                return self._path_to_route_result(path)
+        try:
+            # 初始化所有起點
+            for matrix_row, matrix_col in start_matrix_nodes:
+                pos = matrix_row * W + matrix_col
+                g_score[pos] = 0
+                touched.append(pos)
+                heapq.heappush(open_set, (h_table[pos], pos, 0))
             
-            for dr, dc, move_cost_multiplier in directions:
-                neighbor_row, neighbor_col = current_row + dr, current_col + dc
-                neighbor_pos = (neighbor_row, neighbor_col)
+            while open_set:
+                current_f, current_pos, current_g = heapq.heappop(open_set)
+                if current_g != g_score[current_pos]:
+                    continue  # 過期項目：此節點已用更小的 g 展開過
                 
-                # 檢查邊界
-                if not (0 <= neighbor_row < self.grid_height and 0 <= neighbor_col < self.grid_width):
-                    continue
+                # 找到目標
+                if goal_mask[current_pos]:
+                    path = self._reconstruct_path(current_pos)
+                    return self._path_to_route_result(path)
                 
-                # 檢查是否可行走
-                if not self.walkable[neighbor_row, neighbor_col]:
-                    continue
+                current_row, current_col = divmod(current_pos, W)
                 
-                # 檢查 corner-cutting（僅在斜向移動時）
-                if self.options.allow_diag and move_cost_multiplier == np.sqrt(2):
-                    side1_row, side1_col = current_row + dr, current_col
-                    side2_row, side2_col = current_row, current_col + dc
+                for direction, (dr, dc, move_cost_multiplier) in enumerate(directions):
+                    neighbor_row, neighbor_col = current_row + dr, current_col + dc
+                    
+                    # 檢查邊界與是否可行走
+                    if not (0 <= neighbor_row < H and 0 <= neighbor_col < W):
+                        continue
+                    if not walkable[neighbor_row, neighbor_col]:
+                        continue
                     
-                    side1_blocked = (not (0 <= side1_row < self.grid_height and 0 <= side1_col < self.grid_width) or 
-                                   not self.walkable[side1_row, side1_col])
-                    side2_blocked = (not (0 <= side2_row < self.grid_height and 0 <= side2_col < self.grid_width) or 
-                                   not self.walkable[side2_row, side2_col])
+                    # 檢查 corner-cutting（僅在斜向移動時；兩側格子必在邊界內）
+                    if dr != 0 and dc != 0:
+                        if not walkable[neighbor_row, current_col] and not walkable[current_row, neighbor_col]:
+                            continue  # 禁止 corner-cutting
                     
-                    if side1_blocked and side2_blocked:
-                        continue  # 禁止 corner-cutting
+                    # 計算移動成本
+                    tentative_g_score = current_g + cost[neighbor_row, neighbor_col] * move_cost_multiplier
+                    
+                    # 計算轉彎成本
+                    if turn_weight > 0 and came_from[current_pos] >= 0:
+                        if came_dir[current_pos] != direction:  # 發生轉彎
+                            tentative_g_score += turn_weight
+                    
+                    neighbor_pos = neighbor_row * W + neighbor_col
+                    if tentative_g_score < g_score[neighbor_pos]:
+                        if g_score[neighbor_pos] == np.inf:
+                            touched.append(neighbor_pos)
+                        came_from[neighbor_pos] = current_pos
+                        came_dir[neighbor_pos] = direction
+                        g_score[neighbor_pos] = tentative_g_score
+                        f = tentative_g_score + h_table[neighbor_pos]
+                        heapq.heappush(open_set, (f, neighbor_pos, tentative_g_score))
+            
+            return None  # 無法找到路徑
+        finally:
+            self._reset_search(touched)
+    
+    def astar_auto(self, start_nodes: List[Tuple[int, int]], goal_set: set) -> Optional[RouteResult]:
+        """
+        依起終點距離選擇演算法：距離夠遠且無轉彎成本時用雙向 A*，否則用 astar_multi
+        
+        轉彎成本依賴進入方向，兩個方向的 g 無法直接相加，因此 turn_weight > 0 時一律單向；
+        有 numba 時單向的編譯版本已比 Python 雙向搜尋快，也一律單向。
+        """
+        if not start_nodes or not goal_set:
+            return None
+        if not HAVE_NUMBA and self.options.turn_weight <= 0:
+            dist = min(max(abs(sc - gc), abs(sr - gr)) for sc, sr in start_nodes for gc, gr in goal_set)
+            if dist >= BIDIRECTIONAL_MIN_DIST:
+                return self.astar_bidirectional(start_nodes, goal_set)
+        return self.astar_multi(start_nodes, goal_set)
+    
+    def astar_bidirectional(self, start_nodes: List[Tuple[int, int]], goal_set: set) -> Optional[RouteResult]:
+        """
+        多源多目標雙向 A*（不支援轉彎成本）
+        
+        正向由起點集合、反向由終點集合出發，每次展開 open set 較小的一側；
+        兩側相遇時更新目前最佳路徑成本，任一側堆頂 f 不小於最佳成本時即可停止。
+        
+        Args:
+            start_nodes: 起點候選列表 [(col, row), ...]
+            goal_set: 終點候選集合 {(col, row), ...}
+        
+        Returns:
+            RouteResult 或 None
+        """
+        W, H = self.grid_width, self.grid_height
+        starts = []
+        goals = []
+        for nodes, out in ((start_nodes, starts), (goal_set, goals)):
+            for col, row in nodes:
+                matrix_row, matrix_col = row - self.min_row, col - self.min_col
+                if 0 <= matrix_row < H and 0 <= matrix_col < W and self.walkable[matrix_row, matrix_col]:
+                    out.append((matrix_row, matrix_col))
+        if not starts or not goals:
+            return None
+        start_set, goal_matrix_set = set(starts), set(goals)
+        
+        walkable, cost = self.walkable, self.cost
+        allow_diag = self.options.allow_diag
+        if allow_diag:
+            directions = [(-1, -1, SQRT2), (-1, 0, 1.0), (-1, 1, SQRT2), (0, -1, 1.0),
+                          (0, 1, 1.0), (1, -1, SQRT2), (1, 0, 1.0), (1, 1, SQRT2)]
+        else:
+            directions = [(-1, 0, 1.0), (0, -1, 1.0), (0, 1, 1.0), (1, 0, 1.0)]
+        
+        # 兩側各自的 (g, 前驅, open set, 啟發式表)；反向的 came 指向「往終點的下一格」
+        g_fwd, came_fwd, g_bwd, came_bwd = self._g, self._came, self._g_back, self._came_back
+        sides = (
+            (g_fwd, came_fwd, [], self._heuristic_table(goal_matrix_set), g_bwd),
+            (g_bwd, came_bwd, [], self._heuristic_table(start_set), g_fwd),
+        )
+        touched = []
+        best_cost = np.inf
+        meet = -1
+        
+        try:
+            for (g_score, _, open_set, h_table, _), nodes in zip(sides, (starts, goals)):
+                for matrix_row, matrix_col in nodes:
+                    pos = matrix_row * W + matrix_col
+                    if g_score[pos] == 0:
+                        continue
+                    g_score[pos] = 0.0
+                    touched.append(pos)
+                    heapq.heappush(open_set, (h_table[pos], pos, 0.0))
+            # 起點本身就是終點
+            for matrix_row, matrix_col in starts:
+                pos = matrix_row * W + matrix_col
+                if g_bwd[pos] == 0:
+                    best_cost, meet = 0.0, pos
+                    break
+            
+            open_fwd, open_bwd = sides[0][2], sides[1][2]
+            while open_fwd and open_bwd:
+                if open_fwd[0][0] >= best_cost or open_bwd[0][0] >= best_cost:
+                    break  # 任何尚未展開的路徑都不會比 best_cost 更便宜
                 
-                # 計算移動成本
-                neighbor_cost = self.cost[neighbor_row, neighbor_col]
-                tentative_g_score = g_score[current_pos] + neighbor_cost * move_cost_multiplier
+                backward = len(open_bwd) < len(open_fwd)
+                g_score, came_from, open_set, h_table, g_other = sides[backward]
+                current_f, current_pos, current_g = heapq.heappop(open_set)
+                if current_g != g_score[current_pos]:
+                    continue  # 過期項目
                 
-                # 計算轉彎成本
-                if self.options.turn_weight > 0 and current_pos in came_from:
-                    prev_row, prev_col, prev_dir = came_from[current_pos]
-                    curr_dir = (dr, dc)
-                    if prev_dir != curr_dir:  # 發生轉彎
-                        tentative_g_score += self.options.turn_weight
+                current_row, current_col = divmod(current_pos, W)
+                # 反向時邊 neighbor -> current 的成本是進入 current 的成本
+                if backward:
+                    enter_cost = cost[current_row, current_col]
                 
-                if neighbor_pos not in g_score or tentative_g_score < g_score[neighbor_pos]:
-                    came_from[neighbor_pos] = (current_row, current_col, (dr, dc))
-                    g_score[neighbor_pos] = tentative_g_score
-                    f_score[neighbor_pos] = tentative_g_score + self._heuristic_to_goal_set(neighbor_row, neighbor_col, goal_matrix_set)
-                    heapq.heappush(open_set, (f_score[neighbor_pos], neighbor_row, neighbor_col))
-        
-        return None  # 無法找到路徑
+                for dr, dc, move_cost_multiplier in directions:
+                    neighbor_row, neighbor_col = current_row + dr, current_col + dc
+                    if not (0 <= neighbor_row < H and 0 <= neighbor_col < W):
+                        continue
+                    if not walkable[neighbor_row, neighbor_col]:
+                        continue
+                    
+                    # 禁止 corner-cutting（兩側格子與方向無關，正反向相同）
+                    if dr != 0 and dc != 0:
+                        if not walkable[neighbor_row, current_col] and not walkable[current_row, neighbor_col]:
+                            continue
+                    
+                    if backward:
+                        tentative_g_score = current_g + enter_cost * move_cost_multiplier
+                    else:
+                        tentative_g_score = current_g + cost[neighbor_row, neighbor_col] * move_cost_multiplier
+                    
+                    neighbor_pos = neighbor_row * W + neighbor_col
+                    if tentative_g_score < g_score[neighbor_pos]:
+                        if g_score[neighbor_pos] == np.inf and g_other[neighbor_pos] == np.inf:
+                            touched.append(neighbor_pos)
+                        came_from[neighbor_pos] = current_pos
+                        g_score[neighbor_pos] = tentative_g_score
+                        # 與另一側相遇：更新最佳路徑
+                        total = tentative_g_score + g_other[neighbor_pos]
+                        if total < best_cost:
+                            best_cost, meet = total, neighbor_pos
+                        f = tentative_g_score + h_table[neighbor_pos]
+                        heapq.heappush(open_set, (f, neighbor_pos, tentative_g_score))
+            
+            if meet < 0:
+                return None  # 無法找到路徑
+            
+            # 正向前驅重建到相遇點，再沿反向的下一格走到終點
+            path = self._reconstruct_path(meet)
+            current = came_bwd[meet]
+            while current >= 0:
+                path.append(divmod(int(current), W))
+                current = came_bwd[current]
+            return self._path_to_route_result(path)
+        finally:
+            self._reset_search(touched)
     
     def astar(self, start_col: int, start_row: int, end_col: int, end_row: int) -> Optional[RouteResult]:
         """A* 路徑搜尋"""
-        # 轉換為矩陣座標
-        start_matrix_row, start_matrix_col = self.grid_to_matrix(start_col, start_row)
-        end_matrix_row, end_matrix_col = self.grid_to_matrix(end_col, end_row)
+        # 屬性先綁到區域變數，座標轉換直接展開
+        H, W = self.grid_height, self.grid_width
+        walkable, cost, min_cost = self.walkable, self.cost, self._min_cost
+        start_matrix_row, start_matrix_col = start_row - self.min_row, start_col - self.min_col
+        end_matrix_row, end_matrix_col = end_row - self.min_row, end_col - self.min_col
         
         # 檢查起終點是否在範圍內且可行走
-        if not (0 <= start_matrix_row < self.grid_height and 0 <= start_matrix_col < self.grid_width):
+        if not (0 <= start_matrix_row < H and 0 <= start_matrix_col < W):
             return None
-        if not (0 <= end_matrix_row < self.grid_height and 0 <= end_matrix_col < self.grid_width):
+        if not (0 <= end_matrix_row < H and 0 <= end_matrix_col < W):
             return None
-        if not (self.walkable[start_matrix_row, start_matrix_col] and self.walkable[end_matrix_row, end_matrix_col]):
+        if not (walkable[start_matrix_row, start_matrix_col] and walkable[end_matrix_row, end_matrix_col]):
             return None
         
-        # A* 演算法
-        open_set = []
-        heapq.heappush(open_set, (0, start_matrix_row, start_matrix_col))
-        
-        came_from = {}
-        g_score = {(start_matrix_row, start_matrix_col): 0}
-        f_score = {(start_matrix_row, start_matrix_col): self._heuristic(start_matrix_row, start_matrix_col, end_matrix_row, end_matrix_col)}
+        # A* 演算法（heap 內為 (f, 平面索引, g)，過期項目出堆後略過）
+        g_score, came_from = self._g, self._came
+        start_pos = start_matrix_row * W + start_matrix_col
+        end_pos = end_matrix_row * W + end_matrix_col
+        open_set = [(0, start_pos, 0)]
+        g_score[start_pos] = 0
+        touched = [start_pos]
         
         # 8 向移動
         directions = [
-            (-1,-1, np.sqrt(2)), (-1,0, 1), (-1,1, np.sqrt(2)),
+            (-1,-1, SQRT2), (-1,0, 1), (-1,1, SQRT2),
             (0,-1, 1),                      (0,1, 1),
-            (1,-1, np.sqrt(2)),  (1,0, 1),  (1,1, np.sqrt(2))
+            (1,-1, SQRT2),  (1,0, 1),  (1,1, SQRT2)
         ]
         
-        while open_set:
-            current_f, current_row, current_col = heapq.heappop(open_set)
-            
-            # 找到目標
-            if current_row == end_matrix_row and current_col == end_matrix_col:
-                path = self._reconstruct_path(came_from, (current_row, current_col))
-                return self._path_to_route_result(path)
-            
-            for dr, dc, move_cost_multiplier in directions:
-                neighbor_row, neighbor_col = current_row + dr, current_col + dc
+        try:
+            while open_set:
+                current_f, current_pos, current_g = heapq.heappop(open_set)
+                if current_g != g_score[current_pos]:
+                    continue  # 過期項目：此節點已用更小的 g 展開過
                 
-                # 檢查邊界
-                if not (0 <= neighbor_row < self.grid_height and 0 <= neighbor_col < self.grid_width):
-                    continue
+                # 找到目標
+                if current_pos == end_pos:
+                    path = self._reconstruct_path(current_pos)
+                    return self._path_to_route_result(path)
                 
-                # 檢查是否可行走
-                if not self.walkable[neighbor_row, neighbor_col]:
-                    continue
+                current_row, current_col = divmod(current_pos, W)
                 
-                # 檢查 corner-cutting：斜向移動時兩側直向不能都是障礙
-                if move_cost_multiplier == np.sqrt(2):  # 斜向移動
-                    side1_row, side1_col = current_row + dr, current_col
-                    side2_row, side2_col = current_row, current_col + dc
+                for dr, dc, move_cost_multiplier in directions:
+                    neighbor_row, neighbor_col = current_row + dr, current_col + dc
                     
-                    side1_blocked = (not (0 <= side1_row < self.grid_height and 0 <= side1_col < self.grid_width) or 
-                                   not self.walkable[side1_row, side1_col])
-                    side2_blocked = (not (0 <= side2_row < self.grid_height and 0 <= side2_col < self.grid_width) or 
-                                   not self.walkable[side2_row, side2_col])
+                    # 檢查邊界與是否可行走
+                    if not (0 <= neighbor_row < H and 0 <= neighbor_col < W):
+                        continue
+                    if not walkable[neighbor_row, neighbor_col]:
+                        continue
                     
-                    if side1_blocked and side2_blocked:
-                        continue  # 禁止 corner-cutting
+                    # 檢查 corner-cutting：斜向移動時兩側直向不能都是障礙（兩側格子必在邊界內）
+                    if dr != 0 and dc != 0:
+                        if not walkable[neighbor_row, current_col] and not walkable[current_row, neighbor_col]:
+                            continue  # 禁止 corner-cutting
+                    
+                    # 計算移動成本
+                    tentative_g_score = current_g + cost[neighbor_row, neighbor_col] * move_cost_multiplier
+                    
+                    neighbor_pos = neighbor_row * W + neighbor_col
+                    if tentative_g_score < g_score[neighbor_pos]:
+                        if g_score[neighbor_pos] == np.inf:
+                            touched.append(neighbor_pos)
+                        came_from[neighbor_pos] = current_pos
+                        g_score[neighbor_pos] = tentative_g_score
+                        # octile 啟發式乘上最小格子成本（與 _heuristic_table 的 8 向公式相同）
+                        h_dr = abs(neighbor_row - end_matrix_row)
+                        h_dc = abs(neighbor_col - end_matrix_col)
+                        f = tentative_g_score + min_cost * (h_dr + h_dc + OCTILE_DIAG_DELTA * min(h_dr, h_dc))
+                        heapq.heappush(open_set, (f, neighbor_pos, tentative_g_score))
+            
+            return None  # 無法找到路徑
+        finally:
+            self._reset_search(touched)
+    
+    def _astar_multi_nb(self, start_matrix_nodes: List[Tuple[int, int]], goal_matrix_set: set) -> Optional[RouteResult]:
+        """以 numba 編譯的 _astar_core 執行 astar_multi 的搜尋"""
+        W = self.grid_width
+        starts = np.array([row * W + col for row, col in start_matrix_nodes], dtype=np.int64)
+        goals = np.array(list(goal_matrix_set), dtype=np.int64)
+        goal_mask = np.frombuffer(self._goal_mask(goal_matrix_set), dtype=np.bool_)
+        
+        found, came_from = _astar_core(self.walkable, self._cost_code, self._cost_levels, starts,
+                                       goals[:, 0], goals[:, 1], goal_mask,
+                                       self.options.allow_diag, float(self.options.turn_weight), self._min_cost)
+        if found < 0:
+            return None
+        return self._path_to_route_result(self._reconstruct_path(int(found), came_from))
+    
+    def _astar_multi_jps(self, start_matrix_nodes: List[Tuple[int, int]], goal_matrix_set: set) -> Optional[RouteResult]:
+        """
+        以 Jump Point Search 執行 astar_multi 的搜尋（8 向、成本均一、無轉彎成本）
+        
+        跳點只沿自然與 forced neighbor 方向繼續跳躍；回傳前把跳點之間補回逐格路徑。
+        """
+        W = self.grid_width
+        free = self._padded_walkable()
+        g_score, came_from = self._g, self._came
+        goal_mask = self._goal_mask(goal_matrix_set)
+        h_table = self._heuristic_table(goal_matrix_set)
+        straight_cost = self._min_cost
+        diag_cost = self._min_cost * SQRT2
+        open_set = []
+        touched = []
+        
+        try:
+            for matrix_row, matrix_col in start_matrix_nodes:
+                pos = matrix_row * W + matrix_col
+                g_score[pos] = 0
+                touched.append(pos)
+                heapq.heappush(open_set, (h_table[pos], pos, 0))
+            
+            while open_set:
+                current_f, current_pos, current_g = heapq.heappop(open_set)
+                if current_g != g_score[current_pos]:
+                    continue  # 過期項目
                 
-                # 計算移動成本
-                neighbor_cost = self.cost[neighbor_row, neighbor_col]
-                tentative_g_score = g_score[(current_row, current_col)] + neighbor_cost * move_cost_multiplier
+                if goal_mask[current_pos]:
+                    jump_points = self._reconstruct_path(current_pos)
+                    path = jump_points[:1]
+                    for row, col in jump_points[1:]:
+                        prev_row, prev_col = path[-1]
+                        dr, dc = (row > prev_row) - (row < prev_row), (col > prev_col) - (col < prev_col)
+                        while (prev_row, prev_col) != (row, col):
+                            prev_row, prev_col = prev_row + dr, prev_col + dc
+                            path.append((prev_row, prev_col))
+                    return self._path_to_route_result(path)
                 
-                neighbor_pos = (neighbor_row, neighbor_col)
-                if neighbor_pos not in g_score or tentative_g_score < g_score[neighbor_pos]:
-                    came_from[neighbor_pos] = (current_row, current_col)
-                    g_score[neighbor_pos] = tentative_g_score
-                    f_score[neighbor_pos] = tentative_g_score + self._heuristic(neighbor_row, neighbor_col, end_matrix_row, end_matrix_col)
-                    heapq.heappush(open_set, (f_score[neighbor_pos], neighbor_row, neighbor_col))
+                current_row, current_col = divmod(current_pos, W)
+                for dr, dc in self._jps_directions(current_row, current_col, came_from[current_pos]):
+                    neighbor_row, neighbor_col = current_row + dr, current_col + dc
+                    if not free[neighbor_row + 1][neighbor_col + 1]:
+                        continue
+                    # 禁止 corner-cutting：兩側直向都是障礙時不可斜走
+                    if dr and dc and not (free[current_row + 1][neighbor_col + 1] or free[neighbor_row + 1][current_col + 1]):
+                        continue
+                    
+                    jump_point = self._jump(neighbor_row, neighbor_col, dr, dc, goal_mask)
+                    if jump_point is None:
+                        continue
+                    jump_row, jump_col = jump_point
+                    steps = max(abs(jump_row - current_row), abs(jump_col - current_col))
+                    tentative_g_score = current_g + steps * (diag_cost if dr and dc else straight_cost)
+                    
+                    jump_pos = jump_row * W + jump_col
+                    if tentative_g_score < g_score[jump_pos]:
+                        if g_score[jump_pos] == np.inf:
+                            touched.append(jump_pos)
+                        came_from[jump_pos] = current_pos
+                        g_score[jump_pos] = tentative_g_score
+                        heapq.heappush(open_set, (tentative_g_score + h_table[jump_pos], jump_pos, tentative_g_score))
+            
+            return None  # 無法找到路徑
+        finally:
+            self._reset_search(touched)
+    
+    def _jps_directions(self, row: int, col: int, parent: int) -> List[Tuple[int, int]]:
+        """JPS 剪枝後的展開方向：起點展開 8 向，其餘只取自然方向與 forced neighbor 方向"""
+        if parent < 0:
+            return JPS_DIRECTIONS
+        free = self._padded_walkable()
+        parent_row, parent_col = divmod(int(parent), self.grid_width)
+        dr = (row > parent_row) - (row < parent_row)
+        dc = (col > parent_col) - (col < parent_col)
+        r, c = row + 1, col + 1  # padded 座標
+        if dr and dc:
+            directions = [(0, dc), (dr, 0), (dr, dc)]
+            if not free[r][c - dc]:
+                directions.append((dr, -dc))
+            if not free[r - dr][c]:
+                directions.append((-dr, dc))
+        elif dc:
+            directions = [(0, dc)]
+            if not free[r + 1][c]:
+                directions.append((1, dc))
+            if not free[r - 1][c]:
+                directions.append((-1, dc))
+        else:
+            directions = [(dr, 0)]
+            if not free[r][c + 1]:
+                directions.append((dr, 1))
+            if not free[r][c - 1]:
+                directions.append((dr, -1))
+        return directions
+    
+    def _jump(self, row: int, col: int, dr: int, dc: int, goal_mask: bytearray) -> Optional[Tuple[int, int]]:
+        """
+        JPS 跳躍（Harabor & Grastien 2011）：自 (row, col) 沿 (dr, dc) 前進，
+        遇到目標或 forced neighbor 時回傳該格，撞牆則回傳 None
         
-        return None  # 無法找到路徑
+        forced neighbor 條件依本模組的斜走規則（兩側直向至少一格可走）推導。
+        """
+        free = self._padded_walkable()
+        W = self.grid_width
+        while True:
+            if not free[row + 1][col + 1]:
+                return None
+            if goal_mask[row * W + col]:
+                return row, col
+            r, c = row + 1, col + 1  # padded 座標
+            if dr and dc:
+                if ((free[r + dr][c - dc] and not free[r][c - dc]) or
+                        (free[r - dr][c + dc] and not free[r - dr][c])):
+                    return row, col
+                # 斜向前進時，水平或垂直方向能找到跳點則此格也是跳點
+                if (self._jump(row, col + dc, 0, dc, goal_mask) is not None or
+                        self._jump(row + dr, col, dr, 0, goal_mask) is not None):
+                    return row, col
+                if not (free[r][c + dc] or free[r + dr][c]):
+                    return None  # 下一步斜走會 corner-cutting
+            elif dc:
+                if (free[r + 1][c + dc] and not free[r + 1][c]) or (free[r - 1][c + dc] and not free[r - 1][c]):
+                    return row, col
+            else:
+                if (free[r + dr][c + 1] and not free[r][c + 1]) or (free[r + dr][c - 1] and not free[r][c - 1]):
+                    return row, col
+            row += dr
+            col += dc
     
-    def _heuristic(self, row1: int, col1: int, row2: int, col2: int) -> float:
-        """A* 啟發式函數（歐幾里得距離）"""
-        return np.sqrt((row1 - row2)**2 + (col1 - col2)**2)
+    def _padded_walkable(self) -> List[List[bool]]:
+        """外圍加一圈不可行走格的 walkable（巢狀 list），JPS 查詢時免邊界檢查"""
+        if self._walkable_pad is None:
+            self._walkable_pad = np.pad(self.walkable, 1, constant_values=False).tolist()
+        return self._walkable_pad
     
-    def _heuristic_to_goal_set(self, row: int, col: int, goal_set: set) -> float:
-        """計算到目標集合中最近點的啟發式距離"""
-        if not goal_set:
-            return 0.0
+    def _reset_search(self, touched: List[int]):
+        """把本次搜尋寫過的位置還原為初始值"""
+        self._g[touched] = np.inf
+        self._came[touched] = -1
+        self._came_dir[touched] = 0
+        self._g_back[touched] = np.inf
+        self._came_back[touched] = -1
+    
+    def _goal_mask(self, goal_set: set) -> bytearray:
+        """以平面索引存取的目標遮罩（1 為目標），出堆時查表取代 set 的雜湊查詢"""
+        W = self.grid_width
+        mask = bytearray(self.grid_height * W)
+        for row, col in goal_set:
+            mask[row * W + col] = 1
+        return mask
+    
+    def _heuristic_table(self, goal_set: set) -> Union[List[float], "_GoalSetHeuristic"]:
+        """
+        一次算出所有格子到目標集合最近點的啟發式距離，回傳以平面索引存取的 list
         
-        min_dist = float('inf')
-        for goal_row, goal_col in goal_set:
-            dist = self._heuristic(row, col, goal_row, goal_col)
-            if dist < min_dist:
-                min_dist = dist
+        8 向為 octile 距離、4 向為曼哈頓距離，乘上最小格子成本才不會在低成本格
+        （如 road 0.5）高估，維持 admissible/consistent。每次展開只需查表，不必逐一走訪目標。
+        目標數 x 格數超過 HEURISTIC_TABLE_MAX_CELLS 時整表成本可能高於搜尋本身，
+        改回傳 _GoalSetHeuristic，只在被查詢時逐點計算（數值相同）。
+        """
+        if len(goal_set) * self.grid_height * self.grid_width > HEURISTIC_TABLE_MAX_CELLS:
+            return _GoalSetHeuristic(goal_set, self.grid_width, self.options.allow_diag, self._min_cost)
         
-        return min_dist
+        rows = np.arange(self.grid_height)[:, None]
+        cols = np.arange(self.grid_width)[None, :]
+        table = np.full((self.grid_height, self.grid_width), np.inf)
+        for goal_row, goal_col in goal_set:
+            dr = np.abs(rows - goal_row)
+            dc = np.abs(cols - goal_col)
+            if self.options.allow_diag:
+                dist = self._min_cost * (dr + dc + OCTILE_DIAG_DELTA * np.minimum(dr, dc))
+            else:
+                dist = self._min_cost * (dr + dc)
+            np.minimum(table, dist, out=table)
+        return table.ravel().tolist()
     
-    def _reconstruct_path(self, came_from: dict, current: Tuple[int, int]) -> List[Tuple[int, int]]:
-        """重建路徑"""
-        path = [current]
-        while current in came_from:
+    def _reconstruct_path(self, current: int, came_from: Optional[np.ndarray] = None) -> List[Tuple[int, int]]:
+        """沿著前驅陣列（預設為 self._came）重建路徑，回傳 (row, col) 序列"""
+        W = self.grid_width
+        if came_from is None:
+            came_from = self._came
+        path = [divmod(current, W)]
+        current = came_from[current]
+        while current >= 0:
+            path.append(divmod(int(current), W))
             current = came_from[current]
-            path.append(current)
-        path.reverse()
-        return path
-    
-    def _reconstruct_path_with_direction(self, came_from: dict, current: Tuple[int, int]) -> List[Tuple[int, int]]:
-        """重建路徑（處理包含方向資訊的 came_from）"""
-        path = [current]
-        while current in came_from:
-            prev_row, prev_col, prev_dir = came_from[current]
-            current = (prev_row, prev_col)
-            path.append(current)
         path.reverse()
         return path
     
@@ -472,14 +817,15 @@ class PathfindingGrid:
         unit_path = []
         total_cost = 0.0
         total_length = 0.0
+        min_row, min_col = self.min_row, self.min_col
+        cell_map, cost = self.cell_map, self.cost
         
         for i, (matrix_row, matrix_col) in enumerate(path):
             # 轉換矩陣座標為 unit 座標
-            grid_col, grid_row = self.matrix_to_grid(matrix_row, matrix_col)
-            unit_path.append((grid_col, grid_row))
+            unit_path.append((matrix_col + min_col, matrix_row + min_row))
             
             # 取得該位置的 cell idx
-            cell_idx = self.cell_map[matrix_row, matrix_col]
+            cell_idx = cell_map[matrix_row, matrix_col]
             if cell_idx != -1 and (not route_cells or route_cells[-1] != cell_idx):
                 route_cells.append(cell_idx)
             
@@ -491,12 +837,12 @@ class PathfindingGrid:
                 # 移動距離
                 dr, dc = curr_row - prev_row, curr_col - prev_col
                 if abs(dr) == 1 and abs(dc) == 1:  # 斜向
-                    move_distance = np.sqrt(2)
+                    move_distance = SQRT2
                 else:  # 直向
                     move_distance = 1.0
                 
                 # 移動成本
-                move_cost = self.cost[curr_row, curr_col] * move_distance
+                move_cost = cost[curr_row, curr_col] * move_distance
                 
                 total_length += move_distance
                 total_cost += move_cost
@@ -510,6 +856,187 @@ class PathfindingGrid:
         )
 
 
+class _GoalSetHeuristic:
+    """以平面索引查詢的目標集合啟發式（_heuristic_table 的逐點計算版本，用於大網格 x 多目標）"""
+    
+    __slots__ = ("goals", "width", "allow_diag", "min_cost")
+    
+    def __init__(self, goal_set: set, width: int, allow_diag: bool, min_cost: float):
+        self.goals = list(goal_set)
+        self.width = width
+        self.allow_diag = allow_diag
+        self.min_cost = min_cost
+    
+    def __getitem__(self, pos: int) -> float:
+        row, col = divmod(pos, self.width)
+        best = float('inf')
+        for goal_row, goal_col in self.goals:
+            dr = abs(row - goal_row)
+            dc = abs(col - goal_col)
+            if self.allow_diag:
+                dist = self.min_cost * (dr + dc + OCTILE_DIAG_DELTA * min(dr, dc))
+            else:
+                dist = self.min_cost * (dr + dc)
+            if dist < best:
+                best = dist
+        return best
+
+
+# A* 移動方向（與 PathfindingGrid.astar_multi 的方向順序相同）
+DIR8_ROW = np.array([-1, -1, -1, 0, 0, 1, 1, 1], dtype=np.int64)
+DIR8_COL = np.array([-1, 0, 1, -1, 1, -1, 0, 1], dtype=np.int64)
+DIR4_ROW = np.array([-1, 0, 0, 1], dtype=np.int64)
+DIR4_COL = np.array([0, -1, 1, 0], dtype=np.int64)
+
+
+# JPS 的 8 個展開方向 (dr, dc)
+JPS_DIRECTIONS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+# octile 距離中斜向一步相對兩步直走的差值：sqrt(2) - 2
+OCTILE_DIAG_DELTA = SQRT2 - 2.0
+
+
+@njit(cache=True)
+def _heuristic_nb(row, col, goal_rows, goal_cols, allow_diag, min_cost):
+    """到目標集合最近點的啟發式距離（與 PathfindingGrid._heuristic_table 相同）"""
+    best = np.inf
+    for j in range(len(goal_rows)):
+        dr = abs(row - goal_rows[j])
+        dc = abs(col - goal_cols[j])
+        if allow_diag:
+            d = min_cost * (dr + dc + OCTILE_DIAG_DELTA * min(dr, dc))
+        else:
+            d = min_cost * (dr + dc)
+        if d < best:
+            best = d
+    return best
+
+
+@njit(cache=True)
+def _heap_less(heap_f, heap_idx, a, b):
+    """heap 項目 a 是否排在 b 之前：依 (f, 平面索引) 比較，與 heapq 的 tuple 排序相同"""
+    return heap_f[a] < heap_f[b] or (heap_f[a] == heap_f[b] and heap_idx[a] < heap_idx[b])
+
+
+@njit(cache=True)
+def _heap_swap(heap_f, heap_idx, heap_g, a, b):
+    heap_f[a], heap_f[b] = heap_f[b], heap_f[a]
+    heap_idx[a], heap_idx[b] = heap_idx[b], heap_idx[a]
+    heap_g[a], heap_g[b] = heap_g[b], heap_g[a]
+
+
+@njit(cache=True)
+def _heap_sift_up(heap_f, heap_idx, heap_g, pos):
+    while pos > 0:
+        parent = (pos - 1) >> 1
+        if not _heap_less(heap_f, heap_idx, pos, parent):
+            break
+        _heap_swap(heap_f, heap_idx, heap_g, pos, parent)
+        pos = parent
+
+
+@njit(cache=True)
+def _heap_sift_down(heap_f, heap_idx, heap_g, size):
+    pos = 0
+    while True:
+        child = 2 * pos + 1
+        if child >= size:
+            break
+        if child + 1 < size and _heap_less(heap_f, heap_idx, child + 1, child):
+            child += 1
+        if not _heap_less(heap_f, heap_idx, child, pos):
+            break
+        _heap_swap(heap_f, heap_idx, heap_g, pos, child)
+        pos = child
+
+
+@njit(cache=True)
+def _astar_core(walkable, cost_code, cost_levels, starts, goal_rows, goal_cols, goal_mask, allow_diag, turn_weight, min_cost):
+    """
+    多源多目標 A* 主迴圈（numba 版本，邏輯與 PathfindingGrid.astar_multi 相同）
+    
+    成本以量化的等級編號 cost_code 與等級表 cost_levels 表示（cost = cost_levels[cost_code]）。
+    
+    Returns:
+        (到達的目標平面索引，找不到時為 -1, 前驅陣列)
+    """
+    height, width = walkable.shape
+    n = height * width
+    g_score = np.full(n, np.inf)
+    came_from = np.full(n, -1, dtype=np.int64)
+    came_dir = np.zeros(n, dtype=np.int64)
+    if allow_diag:
+        dir_row, dir_col = DIR8_ROW, DIR8_COL
+    else:
+        dir_row, dir_col = DIR4_ROW, DIR4_COL
+    
+    capacity = max(64, 4 * len(starts))
+    heap_f = np.empty(capacity)
+    heap_idx = np.empty(capacity, dtype=np.int64)
+    heap_g = np.empty(capacity)
+    size = 0
+    
+    for k in range(len(starts)):
+        pos = starts[k]
+        h = _heuristic_nb(pos // width, pos % width, goal_rows, goal_cols, allow_diag, min_cost)
+        g_score[pos] = 0.0
+        heap_f[size], heap_idx[size], heap_g[size] = h, pos, 0.0
+        _heap_sift_up(heap_f, heap_idx, heap_g, size)
+        size += 1
+    
+    while size > 0:
+        current_pos, current_g = heap_idx[0], heap_g[0]
+        size -= 1
+        if size > 0:
+            heap_f[0], heap_idx[0], heap_g[0] = heap_f[size], heap_idx[size], heap_g[size]
+            _heap_sift_down(heap_f, heap_idx, heap_g, size)
+        if current_g != g_score[current_pos]:
+            continue  # 過期項目
+        if goal_mask[current_pos]:
+            return current_pos, came_from
+        
+        current_row, current_col = current_pos // width, current_pos % width
+        for direction in range(len(dir_row)):
+            dr, dc = dir_row[direction], dir_col[direction]
+            neighbor_row, neighbor_col = current_row + dr, current_col + dc
+            if neighbor_row < 0 or neighbor_row >= height or neighbor_col < 0 or neighbor_col >= width:
+                continue
+            if not walkable[neighbor_row, neighbor_col]:
+                continue
+            
+            diagonal = dr != 0 and dc != 0
+            if diagonal:
+                # 禁止 corner-cutting：兩側直向都是障礙時不可斜走
+                side1_blocked = not walkable[neighbor_row, current_col]
+                side2_blocked = not walkable[current_row, neighbor_col]
+                if side1_blocked and side2_blocked:
+                    continue
+                tentative_g_score = current_g + cost_levels[cost_code[neighbor_row, neighbor_col]] * SQRT2
+            else:
+                tentative_g_score = current_g + cost_levels[cost_code[neighbor_row, neighbor_col]]
+            
+            if turn_weight > 0 and came_from[current_pos] >= 0 and came_dir[current_pos] != direction:
+                tentative_g_score += turn_weight
+            
+            neighbor_pos = neighbor_row * width + neighbor_col
+            if tentative_g_score < g_score[neighbor_pos]:
+                came_from[neighbor_pos] = current_pos
+                came_dir[neighbor_pos] = direction
+                g_score[neighbor_pos] = tentative_g_score
+                h = _heuristic_nb(neighbor_row, neighbor_col, goal_rows, goal_cols, allow_diag, min_cost)
+                if size == capacity:
+                    capacity *= 2
+                    heap_f = np.concatenate((heap_f, np.empty(size)))
+                    heap_idx = np.concatenate((heap_idx, np.empty(size, dtype=np.int64)))
+                    heap_g = np.concatenate((heap_g, np.empty(size)))
+                heap_f[size], heap_idx[size], heap_g[size] = tentative_g_score + h, neighbor_pos, tentative_g_score
+                _heap_sift_up(heap_f, heap_idx, heap_g, size)
+                size += 1
+    
+    return -1, came_from
+
+
 def load_grid_types(path: str = "data/grid_types.json") -> dict:
     """載入網格類型定義"""
     try:
@@ -520,6 +1047,37 @@ def load_grid_types(path: str = "data/grid_types.json") -> dict:
         return {}
 
 
+_grid_cache: "OrderedDict[tuple, PathfindingGrid]" = OrderedDict()
+
+
+def _get_grid(cells: List[Cell], grid_types: dict, options: PathfindingOptions) -> PathfindingGrid:
+    """
+    取得 PathfindingGrid，以 LRU 快取最近 GRID_CACHE_SIZE 組 (cells, 類型定義, 選項)
+    
+    cells 以物件身分比對（快取持有參照，id 不會被重用）；類型定義只比對建立矩陣用到的欄位，
+    因此每次重新載入的 grid_types 也能命中。就地修改 cells 後請呼叫 clear_grid_cache()。
+    """
+    types_key = tuple(sorted(
+        (name, info.get('is_walkable', True), info.get('cost', 1.0)) for name, info in grid_types.items()
+    ))
+    key = (id(cells), types_key, options)
+    grid = _grid_cache.get(key)
+    if grid is not None and grid.cells is cells:
+        _grid_cache.move_to_end(key)
+        return grid
+    
+    grid = PathfindingGrid(cells, grid_types, options)
+    _grid_cache[key] = grid
+    if len(_grid_cache) > GRID_CACHE_SIZE:
+        _grid_cache.popitem(last=False)
+    return grid
+
+
+def clear_grid_cache():
+    """清除 find_route 的 PathfindingGrid 快取"""
+    _grid_cache.clear()
+
+
 def find_route(
     cells: List[Cell], 
     start_idx: int, 
@@ -550,14 +1108,15 @@ def find_route(
     
     # 處理向後相容性：如果有舊參數，建立對應的 options
     if options is None:
-        options = PathfindingOptions()
+        legacy = {}
         if diag is not None:
-            options.allow_diag = diag
+            legacy['allow_diag'] = diag
         if allow_enter_area is not None:
-            options.allow_enter_area = allow_enter_area
+            legacy['allow_enter_area'] = allow_enter_area
+        options = PathfindingOptions(**legacy)
     
-    # 建立路徑計算網格
-    pathfinding_grid = PathfindingGrid(cells, grid_types, options)
+    # 取得路徑計算網格（同一份 cells/類型/選項重用快取）
+    pathfinding_grid = _get_grid(cells, grid_types, options)
     
     # 使用新的多邊界演算法
     start_candidates = pathfinding_grid.find_walkable_candidates(start_idx)
@@ -579,8 +1138,8 @@ def find_route(
             return None
         end_candidates = [end_pos]
     
-    # 執行多源多目標 A* 搜尋
-    result = pathfinding_grid.astar_multi(start_candidates, set(end_candidates))
+    # 執行多源多目標 A* 搜尋（長距離時改用雙向）
+    result = pathfinding_grid.astar_auto(start_candidates, set(end_candidates))
     
     if result is None:
         return None
@@ -15,7 +15,7 @@ from typing import List, Dict, Optional
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from core.grid import load_grid, save_grid, Cell
-from core.ocr_ollama import OllamaOCR, OCRResult
+from core.ocr_ollama import OCR_MODEL, OllamaOCR, OCRResult
 
 # 設定日誌
 logging.basicConfig(
@@ -96,7 +96,7 @@ def print_summary(cells: List[Cell], target_types: List[str] = None):
 def main():
     """主函數"""
     parser = argparse.ArgumentParser(description="OCR 批次處理腳本")
-    parser.add_argument("--model", default="qwen2.5vl:7b", help="Ollama 模型名稱")
+    parser.add_argument("--model", default=OCR_MODEL, help="Ollama 模型名稱（預設為 OCR_MODEL 環境變數或 qwen2.5vl:7b）")
     parser.add_argument("--types", nargs="+", default=["booth", "unknown"], 
                        help="要處理的格子類型")
     parser.add_argument("--source-image", default="large_map.png", 
@@ -116,6 +116,8 @@ def main():
                        help="限制處理的格子數量（用於測試）")
     parser.add_argument("--resume", action="store_true", 
                        help="從之前的 OCR 結果續傳")
+    parser.add_argument("--enhance", action="store_true", 
+                       help="送出前先做灰階+二值化處理（舊流程，A/B 比較用）")
     
     args = parser.parse_args()
     
@@ -165,7 +167,7 @@ def main():
         
         # 建立 OCR 處理器
         logger.info(f"初始化 OCR 處理器，模型: {args.model}")
-        ocr = OllamaOCR(model_name=args.model)
+        ocr = OllamaOCR(model_name=args.model, enhance=args.enhance)
         
         # 載入之前的結果（如果有的話）
         ocr_results = {}
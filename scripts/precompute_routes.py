@@ -118,8 +118,8 @@ def precompute_routes(
                 results["statistics"]["failed"] += 1
                 continue
             
-            # 執行多源多目標 A* 搜尋
-            path_result = pathfinding_grid.astar_multi(start_candidates, set(end_candidates))
+            # 執行多源多目標 A* 搜尋（長距離時改用雙向）
+            path_result = pathfinding_grid.astar_auto(start_candidates, set(end_candidates))
             
             if path_result is None:
                 print("無路徑")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+格子座標轉換測試
+
+測試項目：
+- grid_to_pixel_vec 與 grid_to_pixel 一致
+- pixel_to_grid_vec 與 pixel_to_grid 一致（含負數座標與四捨五入邊界）
+"""
+
+import os
+import sys
+
+import numpy as np
+
+# 將專案根目錄加到 Python 路徑中
+current_dir = os.path.dirname(__file__)
+project_root = os.path.abspath(os.path.join(current_dir, '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from core.grid import grid_to_pixel, pixel_to_grid, grid_to_pixel_vec, pixel_to_grid_vec
+
+
+# unit 寬高刻意不同，才能抓出 x/y 軸對調的錯誤
+META = {"unit_w": 93, "unit_h": 94, "origin_x": 3988, "origin_y": 3704}
+
+
+def test_grid_to_pixel_vec():
+    """測試 grid_to_pixel_vec 與純量版本一致"""
+    print("=== 測試 grid_to_pixel_vec ===")
+    cols, rows = np.meshgrid(np.arange(-30, 100), np.arange(-15, 60))
+    xs, ys = grid_to_pixel_vec(cols.ravel(), rows.ravel(), META)
+    for col, row, x, y in zip(cols.ravel().tolist(), rows.ravel().tolist(), xs.tolist(), ys.tolist()):
+        assert grid_to_pixel(col, row, META) == (x, y), f"grid_to_pixel_vec 不一致: ({col}, {row})"
+    print("pass - grid_to_pixel_vec 與 grid_to_pixel 一致\n")
+
+
+def test_pixel_to_grid_vec():
+    """測試 pixel_to_grid_vec 與純量版本一致"""
+    print("=== 測試 pixel_to_grid_vec ===")
+    # 整數像素：涵蓋原點兩側與每個 unit 的中點（四捨五入邊界）
+    xs = np.arange(META["origin_x"] - 500, META["origin_x"] + 500)
+    ys = np.arange(META["origin_y"] - 500, META["origin_y"] + 500)
+    cols, rows = pixel_to_grid_vec(xs, ys, META)
+    for x, y, col, row in zip(xs.tolist(), ys.tolist(), cols.tolist(), rows.tolist()):
+        assert pixel_to_grid(x, y, META) == (col, row), f"pixel_to_grid_vec 不一致: ({x}, {y})"
+    print("pass - 整數像素座標一致")
+    
+    # 浮點像素（如縮放後的滑鼠座標）
+    rng = np.random.default_rng(0)
+    xs = rng.uniform(0, 12000, 2000)
+    ys = rng.uniform(0, 8000, 2000)
+    cols, rows = pixel_to_grid_vec(xs, ys, META)
+    for x, y, col, row in zip(xs.tolist(), ys.tolist(), cols.tolist(), rows.tolist()):
+        assert pixel_to_grid(x, y, META) == (col, row), f"pixel_to_grid_vec 不一致: ({x}, {y})"
+    print("pass - 浮點像素座標一致")
+    
+    # 反轉換：格子左上角像素應回到原格子
+    grid_cols, grid_rows = np.arange(-20, 80), np.arange(-10, 90)
+    cols, rows = pixel_to_grid_vec(*grid_to_pixel_vec(grid_cols, grid_rows, META), META)
+    assert np.array_equal(cols, grid_cols) and np.array_equal(rows, grid_rows), "來回轉換不一致"
+    print("pass - grid → pixel → grid 來回轉換一致\n")
+
+
+def run_all_tests():
+    """執行所有測試"""
+    print("開始執行格子座標轉換測試...\n")
+    
+    tests = [
+        ("grid_to_pixel_vec", test_grid_to_pixel_vec),
+        ("pixel_to_grid_vec", test_pixel_to_grid_vec),
+    ]
+    passed_count = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            passed_count += 1
+        except Exception as e:
+            print(f"fail - {test_name} 測試失敗: {e}\n")
+    
+    print("=" * 50)
+    print(f"測試總結: {passed_count}/{len(tests)} 個測試通過")
+    return passed_count == len(tests)
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
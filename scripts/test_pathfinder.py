@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+路徑計算模組測試
+
+測試項目：
+- 大網格 x 多目標時 _heuristic_table 改用逐點計算的備援
+- 備援與整表查詢的啟發式數值、搜尋結果相同
+"""
+
+import io
+import os
+import sys
+import random
+import contextlib
+
+# 將專案根目錄加到 Python 路徑中
+current_dir = os.path.dirname(__file__)
+project_root = os.path.abspath(os.path.join(current_dir, '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+import core.pathfinder as pathfinder
+from core.grid import Cell
+from core.pathfinder import PathfindingGrid, PathfindingOptions
+
+
+GRID_TYPES = {
+    "road": {"is_walkable": True, "cost": 0.5},
+    "Lounge": {"is_walkable": True, "cost": 1.0},
+    "wall": {"is_walkable": False, "cost": 1.0},
+}
+
+
+def build_grid(allow_diag: bool, size: int = 40, seed: int = 0) -> PathfindingGrid:
+    """建立隨機的 road / Lounge / wall 測試網格"""
+    rnd = random.Random(seed)
+    cells = []
+    for row in range(size):
+        for col in range(size):
+            cell_type = rnd.choices(["road", "Lounge", "wall"], weights=[6, 2, 2])[0]
+            cells.append(Cell(idx=row * size + col, x=0, y=0, w=1, h=1, col=col, row=row, type=cell_type))
+    with contextlib.redirect_stdout(io.StringIO()):
+        return PathfindingGrid(cells, GRID_TYPES, PathfindingOptions(allow_diag=allow_diag))
+
+
+def test_heuristic_table_fallback():
+    """測試超過上限時改用逐點計算，數值與整表相同"""
+    print("=== 測試啟發式整表上限備援 ===")
+    
+    original_limit = pathfinder.HEURISTIC_TABLE_MAX_CELLS
+    try:
+        for allow_diag in (False, True):
+            grid = build_grid(allow_diag)
+            walkable_rc = [tuple(rc) for rc in grid._walkable_coords().tolist()]
+            goals = set(random.Random(1).sample(walkable_rc, 5))
+            
+            pathfinder.HEURISTIC_TABLE_MAX_CELLS = 10 ** 9
+            table = grid._heuristic_table(goals)
+            assert isinstance(table, list), "未超過上限時應回傳整張表"
+            
+            # 上限低於 目標數 x 格數 時走備援
+            pathfinder.HEURISTIC_TABLE_MAX_CELLS = len(goals) * grid.grid_height * grid.grid_width - 1
+            lazy = grid._heuristic_table(goals)
+            assert isinstance(lazy, pathfinder._GoalSetHeuristic), "超過上限時應改用逐點計算"
+            for pos in range(grid.grid_height * grid.grid_width):
+                assert lazy[pos] == table[pos], f"備援數值不一致: pos={pos}"
+        print("pass - 備援觸發條件與啟發式數值正確")
+    finally:
+        pathfinder.HEURISTIC_TABLE_MAX_CELLS = original_limit
+    
+    print("啟發式整表上限測試通過！\n")
+
+
+def test_search_with_fallback():
+    """測試備援下 astar_multi / astar_bidirectional 結果與整表相同"""
+    print("=== 測試備援下的搜尋結果 ===")
+    
+    original_limit = pathfinder.HEURISTIC_TABLE_MAX_CELLS
+    original_numba = pathfinder.HAVE_NUMBA
+    pathfinder.HAVE_NUMBA = False  # 只有 Python 搜尋迴圈會用到啟發式表
+    try:
+        for allow_diag in (False, True):
+            grid = build_grid(allow_diag, seed=2)
+            walkable = [(col + grid.min_col, row + grid.min_row)
+                        for row, col in grid._walkable_coords().tolist()]
+            rnd = random.Random(3)
+            for _ in range(20):
+                starts = rnd.sample(walkable, 2)
+                goals = set(rnd.sample(walkable, 3))
+                
+                pathfinder.HEURISTIC_TABLE_MAX_CELLS = 10 ** 9
+                expected = (grid.astar_multi(starts, goals), grid.astar_bidirectional(starts, goals))
+                pathfinder.HEURISTIC_TABLE_MAX_CELLS = 0
+                actual = (grid.astar_multi(starts, goals), grid.astar_bidirectional(starts, goals))
+                assert actual == expected, f"備援搜尋結果不一致: {starts} -> {goals}"
+        print("pass - 備援下 astar_multi / astar_bidirectional 結果與整表相同")
+    finally:
+        pathfinder.HEURISTIC_TABLE_MAX_CELLS = original_limit
+        pathfinder.HAVE_NUMBA = original_numba
+    
+    print("備援搜尋測試通過！\n")
+
+
+def run_all_tests():
+    """執行所有測試"""
+    print("開始執行路徑計算模組測試...\n")
+    
+    tests = [
+        ("啟發式整表上限備援", test_heuristic_table_fallback),
+        ("備援下的搜尋結果", test_search_with_fallback),
+    ]
+    passed_count = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            passed_count += 1
+        except Exception as e:
+            print(f"fail - {test_name} 測試失敗: {e}\n")
+    
+    print("=" * 50)
+    print(f"測試總結: {passed_count}/{len(tests)} 個測試通過")
+    return passed_count == len(tests)
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)